@@ -29,27 +29,27 @@ dispatcher = TextToAction(actions_folder = calculator_actions_folder, llm_client
 
 @app.post("/extract_actions")
 async def extract_actions(request:FunctionsRequest):
-    result =  dispatcher.extract_actions(query_text=request.text,
+    result = await dispatcher.aextract_actions(query_text=request.text,
                                     top_k=request.top_k,threshold=request.threshold)
 
     return json.dumps(result)
 
 @app.post("/extract_arguments")
 async def extract_arguments(request:ArgumentsRequest):
-    result = dispatcher.extract_parameters(query_text=request.text, action_name=request.action_name, args = request.args)
+    result = await dispatcher.aextract_parameters(query_text=request.text, action_name=request.action_name, args = request.args)
 
     return json.dumps(result)
          
 @app.post("/extract_actions_with_args")
 async def extract_actions_with_args(request:FunctionsRequest):
-    result =  dispatcher.extract_actions_with_args(query_text=request.text,
+    result = await dispatcher.aextract_actions_with_args(query_text=request.text,
                                     top_k=request.top_k,threshold=request.threshold)
 
     return json.dumps(result)
 
 @app.post("/run")
 async def run( request:FunctionsRequest):
-    result =  dispatcher.run(query_text=request.text,
+    result = await dispatcher.arun(query_text=request.text,
                                     top_k=request.top_k,threshold=request.threshold)
 
     return json.dumps(result)
@@ -2,6 +2,27 @@ import os
 # Construct the path to the action_embeddings directory
 EMBEDDINGS_DIR = os.path.join(os.path.dirname(__file__), "action_embeddings")
 ACTIONS_DIR = os.path.join(os.path.dirname(__file__), "actions")
-from .main import TextToAction
-from .llm_utils import LLMClient, ConversationManager
-from .create_actions import create_actions_embeddings
\ No newline at end of file
+
+# The public classes are imported on first access, so that `import text_to_action` doesn't
+# pull in torch, transformers, litellm etc. until they are actually needed.
+_LAZY_ATTRIBUTES = {
+    "TextToAction": ".main",
+    "LLMClient": ".llm_utils",
+    "ConversationManager": ".llm_utils",
+    "create_actions_embeddings": ".create_actions",
+}
+
+__all__ = ["EMBEDDINGS_DIR", "ACTIONS_DIR", *_LAZY_ATTRIBUTES]
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        import importlib
+        value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_ATTRIBUTES))
@@ -0,0 +1,146 @@
+import math
+from typing import Callable, Tuple
+import h5py
+import torch
+from .utils import atomic_write_path
+
+
+class IVFIndex:
+    """
+    Inverted file (IVF) index for approximate nearest-neighbor search over a normalized embedding matrix.
+
+    Rows are clustered around n_lists centroids with spherical k-means. A query only scores the rows of the
+    n_probe lists whose centroids are closest to it, so the cost grows with roughly n_probe * N / n_lists
+    instead of N. Rows appended after the index was built are kept in an unindexed tail that is always scanned exactly.
+    """
+
+    def __init__(self, n_lists:int=None, n_probe:int=8, n_iter:int=20, seed:int=0, rebuild_ratio:float=0.1):
+        """
+        Args:
+            n_lists (int, optional): The number of clusters. Defaults to 4 * sqrt(N) at build time.
+            n_probe (int, optional): The number of clusters scanned per query. Defaults to 8.
+            n_iter (int, optional): The number of k-means iterations. Defaults to 20.
+            seed (int, optional): Seed for the centroid initialization. Defaults to 0.
+            rebuild_ratio (float, optional): Rebuild the index once the unindexed tail exceeds this fraction of the indexed rows. Defaults to 0.1.
+        """
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.seed = seed
+        self.rebuild_ratio = rebuild_ratio
+
+        self.centroids:torch.Tensor = None
+        # Row ids grouped by list: the rows of list i are list_rows[list_offsets[i]:list_offsets[i + 1]]
+        self.list_rows:torch.Tensor = None
+        self.list_offsets:torch.Tensor = None
+        self.n_rows = 0
+
+    def __str__(self):
+        n_lists = 0 if self.centroids is None else self.centroids.shape[0]
+        return f"{self.__class__.__name__} with {n_lists} lists over {self.n_rows} rows"
+
+    @property
+    def is_built(self)->bool:
+        return self.centroids is not None
+
+    def needs_rebuild(self, n_rows:int)->bool:
+        """
+        Returns True if the index is missing, stale, or its unindexed tail has grown too large.
+        """
+        if not self.is_built or n_rows < self.n_rows:
+            return True
+        return (n_rows - self.n_rows) > self.rebuild_ratio * max(self.n_rows, 1)
+
+    def build(self, matrix:torch.Tensor):
+        """
+        Clusters the rows of a normalized (N x D) matrix.
+        """
+        matrix = matrix.float()
+        n_rows = matrix.shape[0]
+        n_lists = self.n_lists or max(1, int(4 * math.sqrt(n_rows)))
+        n_lists = min(n_lists, n_rows)
+
+        generator = torch.Generator().manual_seed(self.seed)
+        centroids = matrix[torch.randperm(n_rows, generator=generator)[:n_lists]].clone()
+        for _ in range(self.n_iter):
+            assignments = torch.argmax(matrix @ centroids.T, dim=1)
+            sums = torch.zeros_like(centroids).index_add_(0, assignments, matrix)
+            counts = torch.bincount(assignments, minlength=n_lists)
+            # Keep the previous centroid for empty clusters
+            sums[counts == 0] = centroids[counts == 0]
+            centroids = torch.nn.functional.normalize(sums, dim=1)
+
+        assignments = torch.argmax(matrix @ centroids.T, dim=1)
+        self.centroids = centroids
+        self.list_rows = torch.argsort(assignments, stable=True)
+        counts = torch.bincount(assignments, minlength=n_lists)
+        self.list_offsets = torch.cat([torch.zeros(1, dtype=torch.long), torch.cumsum(counts, dim=0)])
+        self.n_rows = n_rows
+
+    def candidate_rows(self, query_emb:torch.Tensor, n_total_rows:int, row_mask:torch.Tensor=None)->torch.Tensor:
+        """
+        Returns the row ids to score for a normalized query: the rows of the n_probe closest lists plus the unindexed tail,
+        restricted to the rows in row_mask if one is given.
+        """
+        n_probe = min(self.n_probe, self.centroids.shape[0])
+        lists = torch.topk(self.centroids @ query_emb, k=n_probe).indices.tolist()
+        parts = [self.list_rows[self.list_offsets[i]:self.list_offsets[i + 1]] for i in lists]
+        if n_total_rows > self.n_rows:
+            parts.append(torch.arange(self.n_rows, n_total_rows))
+        candidates = torch.cat(parts)
+        return candidates if row_mask is None else candidates[row_mask[candidates]]
+
+    def search(self, score_rows:Callable[[torch.Tensor, torch.Tensor], torch.Tensor], query_embs:torch.Tensor,
+               n_total_rows:int, k:int, row_mask:torch.Tensor=None)->Tuple[list, list]:
+        """
+        Approximate top-k search for a (B x D) batch of normalized queries.
+
+        Args:
+            score_rows: Returns the (1 x R) scores of a (1 x D) query against the given row ids.
+            query_embs: The (B x D) normalized queries.
+            n_total_rows: The current number of rows in the matrix, including rows added after the build.
+            k: The number of results per query.
+            row_mask: Optional (N,) boolean mask of the rows that may be returned.
+
+        Returns:
+            Tuple[list, list]: For each query, the list of scores and the list of row ids, best first.
+        """
+        all_scores, all_rows = [], []
+        for query_emb in query_embs:
+            candidates = self.candidate_rows(query_emb, n_total_rows, row_mask=row_mask)
+            scores = score_rows(query_emb.reshape(1, -1), candidates)[0]
+            top = torch.topk(scores, k=min(k, scores.shape[0]))
+            all_scores.append(top.values.tolist())
+            all_rows.append(candidates[top.indices].tolist())
+        return all_scores, all_rows
+
+    def reset(self):
+        self.centroids = None
+        self.list_rows = None
+        self.list_offsets = None
+        self.n_rows = 0
+
+    def save(self, file_path:str, build_id:str=None):
+        """
+        Saves the index to a file. build_id ties the index to the embeddings file it was built from.
+        """
+        with atomic_write_path(file_path) as tmp_path, h5py.File(tmp_path, 'w') as f:
+            f.create_dataset("centroids", data=self.centroids.numpy())
+            f.create_dataset("list_rows", data=self.list_rows.numpy())
+            f.create_dataset("list_offsets", data=self.list_offsets.numpy())
+            f.attrs["n_rows"] = self.n_rows
+            f.attrs["build_id"] = build_id or ""
+
+    def load(self, file_path:str)->str:
+        """
+        Loads the index from a file.
+
+        Returns:
+            str: The build_id the index was saved with.
+        """
+        with h5py.File(file_path, 'r') as f:
+            self.centroids = torch.from_numpy(f["centroids"][()])
+            self.list_rows = torch.from_numpy(f["list_rows"][()])
+            self.list_offsets = torch.from_numpy(f["list_offsets"][()])
+            self.n_rows = int(f.attrs["n_rows"])
+            return f.attrs.get("build_id", "")
@@ -0,0 +1,148 @@
+import asyncio
+import concurrent.futures
+import queue
+import threading
+import time
+from collections import Counter, deque
+from typing import Callable, Dict, List, Sequence
+
+
+class _Request:
+    __slots__ = ("text", "future", "enqueued_at")
+
+    def __init__(self, text:str):
+        self.text = text
+        self.future = concurrent.futures.Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class EmbeddingMicroBatcher:
+    """
+    Collects texts from concurrent callers and encodes them together.
+
+    A single worker thread waits up to max_wait_ms after the first queued text (or until max_batch_size texts are queued),
+    encodes the batch with one call to encode_fn, and hands each caller its row. Since only the worker runs the encoder,
+    concurrent requests no longer contend for torch's intra-op threads.
+    """
+    def __init__(self, encode_fn:Callable[[List[str]], Sequence], max_batch_size:int=32, max_wait_ms:float=2.0,
+                 max_recorded_delays:int=10000):
+        """
+        Args:
+            encode_fn: Encodes a list of texts, returning one row per text (e.g. VectorStore.vectorize_texts).
+            max_batch_size: The maximum number of texts encoded per call. Defaults to 32.
+            max_wait_ms: How long to wait for more texts after the first one is queued. Defaults to 2 ms.
+            max_recorded_delays: The number of most recent queueing delays kept for the statistics. Defaults to 10000.
+        """
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._queue_delays_ms = deque(maxlen=max_recorded_delays)
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="EmbeddingMicroBatcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, text:str)->concurrent.futures.Future:
+        """
+        Queues a text and returns a future for its embedding.
+        """
+        if self._closed:
+            raise RuntimeError("The micro-batcher is closed")
+        request = _Request(text)
+        self._queue.put(request)
+        return request.future
+
+    def encode(self, text:str):
+        """
+        Returns the embedding of a text, blocking until its batch has been encoded. Safe to call from many threads.
+        """
+        return self.submit(text).result()
+
+    def encode_many(self, texts:List[str])->list:
+        """
+        Returns the embeddings of several texts, which may be batched together with other callers' texts.
+        """
+        futures = [self.submit(text) for text in texts]
+        return [future.result() for future in futures]
+
+    async def aencode(self, text:str):
+        """
+        Returns the embedding of a text without blocking the event loop.
+        """
+        return await asyncio.wrap_future(self.submit(text))
+
+    async def aencode_many(self, texts:List[str])->list:
+        return await asyncio.gather(*(self.aencode(text) for text in texts))
+
+    def _next_batch(self)->List[_Request]:
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                # Finish this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            started_at = time.perf_counter()
+            with self._stats_lock:
+                self._batch_sizes[len(batch)] += 1
+                self._queue_delays_ms.extend((started_at - request.enqueued_at) * 1000 for request in batch)
+
+            try:
+                embeddings = self.encode_fn([request.text for request in batch])
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            for request, embedding in zip(batch, embeddings):
+                request.future.set_result(embedding)
+
+    def close(self):
+        """
+        Stops the worker once the queued texts have been encoded.
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._worker.join()
+
+    def stats(self)->Dict[str, object]:
+        """
+        Returns the batch-size distribution and queueing-delay statistics.
+        """
+        with self._stats_lock:
+            batch_sizes = dict(sorted(self._batch_sizes.items()))
+            delays = sorted(self._queue_delays_ms)
+        n_batches = sum(batch_sizes.values())
+        n_requests = sum(size * count for size, count in batch_sizes.items())
+
+        def percentile(p):
+            return delays[min(len(delays) - 1, int(p * len(delays)))] if delays else 0.0
+
+        return {"batches": n_batches,
+                "requests": n_requests,
+                "mean_batch_size": n_requests / n_batches if n_batches else 0.0,
+                "batch_size_histogram": batch_sizes,
+                "queue_delay_ms": {"mean": sum(delays) / len(delays) if delays else 0.0,
+                                   "p50": percentile(0.5), "p95": percentile(0.95), "max": delays[-1] if delays else 0.0}}
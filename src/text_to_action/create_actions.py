@@ -1,9 +1,12 @@
-from .vector_emb import VectorStore, ModelSource
 import json
-from .types import validate_functions
+import os
+from .types import validate_functions, ModelSource, IndexType, EmbeddingDType
 
 def create_actions_embeddings(functions_description_filepath:str, save_to:str, validate_data:bool=False,
-                              embedding_model:str="all-MiniLM-L6-v2",model_source=ModelSource.SBERT):
+                              embedding_model:str="all-MiniLM-L6-v2",model_source=ModelSource.SBERT,
+                              batch_size:int=64, show_progress:bool=True,
+                              index_type=IndexType.EXACT, index_params:dict=None,
+                              storage_dtype=EmbeddingDType.FLOAT32, incremental:bool=True):
     """
     Creates embeddings (VectorStore) for the given functions_description and saves it to a file (.h5).
 
@@ -13,6 +16,16 @@ def create_actions_embeddings(functions_description_filepath:str, save_to:str, v
         validate_data: Optionally, you can validate the functions description data to check if they are in correct format and expected types.
         embedding_model: The name of the embedding model.
         model_soruce: Either SBERT or a huggin face model.
+        batch_size: The number of descriptions/examples to encode per call to the embedding model.
+        show_progress: If True, prints the encoding progress and throughput.
+        index_type: Set to IndexType.IVF to also build an approximate nearest-neighbor index, saved next to the embeddings file.
+        index_params: Keyword arguments for the index (e.g. n_lists, n_probe).
+        storage_dtype: Precision of the saved embeddings (FLOAT32, FLOAT16 or INT8). For reduced precisions, the accuracy delta against float32 is printed.
+        incremental: If True and save_to already exists, embeddings of unchanged texts (same model and text) are reused from it,
+            so only new or changed descriptions/examples are encoded. Rows of removed actions are dropped.
+
+    The descriptions and examples themselves are saved with the embeddings, so that a lexical index (see LexicalIndex)
+    can be built from the same file at load time.
 
     Example:
         functions_description = { 
@@ -34,6 +47,9 @@ def create_actions_embeddings(functions_description_filepath:str, save_to:str, v
                             }
             }
     """
+    import torch
+    from .vector_emb import VectorStore
+
     with open(functions_description_filepath, 'r') as f:
         functions_description = json.load(f)
 
@@ -42,15 +58,56 @@ def create_actions_embeddings(functions_description_filepath:str, save_to:str, v
         if len(invalid_data)>0:
             raise ValueError(f"Invalid function descriptions found: {', '.join(invalid_data)}") 
 
-    store = VectorStore(embedding_model=embedding_model,model_source=model_source)
+    store = VectorStore(embedding_model=embedding_model,model_source=model_source,
+                        index_type=index_type,index_params=index_params,storage_dtype=EmbeddingDType.FLOAT32)
+    texts, metadata = [], []
     for function_name, details in functions_description.items():
-        store.add_vector(text=details["description"],id_name=function_name)
-        for prompt in details["examples"]:
-            store.add_vector(text=prompt,id_name=function_name)
+        for text in [details["description"]] + details["examples"]:
+            texts.append(text)
+            metadata.append({"id_name": function_name, "content_hash": store.content_hash(text), "text": text})
+
+    previous_embeddings = {}
+    if incremental:
+        previous_embeddings = load_previous_embeddings(store, save_to)
+
+    missing = [i for i, node_metadata in enumerate(metadata) if node_metadata["content_hash"] not in previous_embeddings]
+    encoded = store.encode_texts([texts[i] for i in missing], batch_size=batch_size, show_progress=show_progress)
+    encoded_by_index = dict(zip(missing, encoded))
+    embeddings = [encoded_by_index[i] if i in encoded_by_index else previous_embeddings[node_metadata["content_hash"]]
+                  for i, node_metadata in enumerate(metadata)]
+    store.add_embeddings(torch.stack(embeddings) if embeddings else torch.zeros((0, 0)), metadata=metadata)
+
+    if incremental:
+        current_hashes = {node_metadata["content_hash"] for node_metadata in metadata}
+        dropped = sum(1 for content_hash in previous_embeddings if content_hash not in current_hashes)
+        print(f"Reused {len(texts) - len(missing)} embeddings, encoded {len(missing)} new or changed texts, "
+              f"dropped {dropped} stale embeddings ({len(texts) - len(missing)} encodes saved)")
+    if storage_dtype != EmbeddingDType.FLOAT32:
+        print("Quantization report against float32:", store.quantization_report(storage_dtype))
+        store.convert_storage(storage_dtype)
 
     store.save(save_to)
+    if store.index is not None:
+        print("Index recall against exact search:", store.evaluate_recall())
 
     return
+
+def load_previous_embeddings(store:"VectorStore", save_to:str):
+    """
+    Returns the embeddings of a previously saved file by content hash, or an empty dict if there is nothing to reuse.
+    """
+    from .vector_emb import VectorStore
+
+    file_path = VectorStore._resolve_path(save_to)
+    if not os.path.isfile(file_path):
+        return {}
+    previous_store = VectorStore(embedding_model=store.embedding_model)
+    try:
+        previous_store.load(file_path)
+    except Exception as e:
+        print(f"Could not read previous embeddings from {file_path}, encoding everything: {e}")
+        return {}
+    return previous_store.embeddings_by_content_hash()
     
 if __name__ == '__main__':
     import time
@@ -62,4 +119,4 @@ if __name__ == '__main__':
     initial_time = time.time()
     create_actions_embeddings(descriptions_filepath, save_to=save_to,validate_data=True)
     print("\n================================")
-    print("Creating embeddings took: " + str(time.time() - initial_time , "seconds"))
\ No newline at end of file
+    print("Creating embeddings took: " + str(time.time() - initial_time) + " seconds")
\ No newline at end of file
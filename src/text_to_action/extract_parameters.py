@@ -1,13 +1,18 @@
+import asyncio
 from abc import ABC, abstractmethod
 from typing import Dict, Any, List
 from .utils import verbose_print
 import inspect
 from collections import Counter
 from pydantic import BaseModel
-from .llm_utils import llm_extract_parameters, llm_map_pydantic_parameters,llm_extract_all_parameters,LLMClient
+from .llm_utils import llm_extract_parameters, llm_map_pydantic_parameters,llm_extract_all_parameters,allm_extract_all_parameters,LLMClient
+from .llm_utils import llm_extract_parameters_for_actions, allm_extract_parameters_for_actions
 from .entity_models import *
 
 class ParameterExtractor(ABC):
+    # True if extract_parameters may be called from several threads (or tasks) at once
+    thread_safe = True
+
     def __init__(self,llm_client: LLMClient):
         self.llm_client = llm_client
 
@@ -16,11 +21,32 @@ class ParameterExtractor(ABC):
 
         pass
 
+    async def aextract_parameters(self, query_text: str, function_name: Union[callable,str], **kwargs) -> Dict[str, Any]:
+        """
+        Async variant of extract_parameters. By default, extract_parameters runs in a worker thread so it doesn't block the event loop.
+        """
+        return await asyncio.to_thread(self.extract_parameters, query_text, function_name, **kwargs)
+
+    def extract_parameters_for_actions(self, query_text: str, arguments_dict: Dict[str,Dict[str,Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Extracts the parameters of several actions at once. Returns a dictionary mapping action names to their parameters;
+        actions missing from it are extracted one by one with extract_parameters. By default, nothing is extracted at once.
+        """
+        return {}
+
+    async def aextract_parameters_for_actions(self, query_text: str, arguments_dict: Dict[str,Dict[str,Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Async variant of extract_parameters_for_actions.
+        """
+        return await asyncio.to_thread(self.extract_parameters_for_actions, query_text, arguments_dict)
+
     def clear(self):
         return
 
 class NERParameterExtractor(ParameterExtractor):
-    
+    # The recognized entities are kept on the instance between clear() and extract_parameters
+    thread_safe = False
+
     def __init__(self, spacy_model_ner: str,llm_client: LLMClient):
         import spacy
         self.entity_recognizer = spacy.load(spacy_model_ner)
@@ -143,3 +169,28 @@ class LLMParameterExtractor(ParameterExtractor):
         """
         return llm_extract_all_parameters(function_name=function_name, query_text=query_text,
                                           llm_client=self.llm_client,args_dict=arguments_dict)
+
+    async def aextract_parameters(self, query_text: str, function_name: Union[callable,str],arguments_dict:Dict[str,Dict[str,Any]]=None) -> Dict[str, Any]:
+        """
+        Same as extract_parameters, awaiting the LLM call.
+        """
+        return await allm_extract_all_parameters(function_name=function_name, query_text=query_text,
+                                                 llm_client=self.llm_client,args_dict=arguments_dict)
+
+    def extract_parameters_for_actions(self, query_text: str, arguments_dict: Dict[str,Dict[str,Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Extract the parameters of every action in arguments_dict with a single LLM call.
+
+        Args:
+            query_text: The input text to analyze for parameter extraction.
+            arguments_dict: A dictionary mapping each action name to its parameter names and types.
+        Returns:
+            A dictionary mapping action names to their extracted parameters.
+        """
+        return llm_extract_parameters_for_actions(query_text=query_text, actions_args=arguments_dict, llm_client=self.llm_client)
+
+    async def aextract_parameters_for_actions(self, query_text: str, arguments_dict: Dict[str,Dict[str,Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Same as extract_parameters_for_actions, awaiting the LLM call.
+        """
+        return await allm_extract_parameters_for_actions(query_text=query_text, actions_args=arguments_dict, llm_client=self.llm_client)
@@ -0,0 +1,115 @@
+import json
+from typing import Any, Dict, List, Tuple
+
+
+class IncrementalJSONParser:
+    """
+    Parses a JSON object while it is being generated, and reports its values as soon as they are complete.
+
+    Text before the first "{" (e.g. a "```json" fence) is skipped. Two kinds of values are reported, as (path, value):
+        - each member of the object, e.g. (("message",), "Sure.") or (("a",), 20) for extracted parameters
+        - each element of a member that is an array, e.g. (("actions", 0), "resize image to 300x300"), before the array itself
+    Values that aren't valid JSON on their own are skipped; the caller can still parse the full text at the end.
+    """
+    def __init__(self):
+        self.buffer = ""
+        # The members of the object completed so far
+        self.result:Dict[str, Any] = {}
+        # True once the object is closed; the text after it is ignored
+        self.done = False
+        self._pos = 0
+        # The open containers, "{" or "["
+        self._stack:List[str] = []
+        self._in_string = False
+        self._escape = False
+        # The depth of the scalar (number, true, false, null) being read, or None
+        self._scalar_depth:int = None
+        # What comes next at depth 1: "key", "value" (after the colon)
+        self._expect = "key"
+        self._key:str = None
+        self._index = 0
+        # depth -> (path, start offset) of the reported values that are still open
+        self._starts:Dict[int, Tuple[Any, int]] = {}
+
+    def feed(self, text:str)->List[Tuple[tuple, Any]]:
+        """
+        Adds the next chunk of text and returns the values completed by it, in order.
+        """
+        self.buffer += text
+        events = []
+        while self._pos < len(self.buffer) and not self.done:
+            self._step(self._pos, self.buffer[self._pos], events)
+            self._pos += 1
+        return events
+
+    def _step(self, i:int, ch:str, events:list):
+        depth = len(self._stack)
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+                self._close(depth, i + 1, events)
+            return
+
+        if self._scalar_depth is not None:
+            if not (ch in ",]}" or ch.isspace()):
+                return
+            self._close(self._scalar_depth, i, events)
+            self._scalar_depth = None
+
+        if depth == 0:
+            if ch == "{":
+                self._stack.append(ch)
+                self._expect = "key"
+            return
+        if ch.isspace():
+            return
+
+        if ch == '"':
+            self._open(depth, i)
+            self._in_string = True
+        elif ch in "{[":
+            self._open(depth, i)
+            self._stack.append(ch)
+            if depth == 1 and ch == "[":
+                self._index = 0
+        elif ch in "}]":
+            self._stack.pop()
+            self._close(len(self._stack), i + 1, events)
+            self.done = not self._stack
+        elif ch == ":":
+            if depth == 1:
+                self._expect = "value"
+        elif ch == ",":
+            if depth == 1:
+                self._expect = "key"
+            elif depth == 2 and self._stack[1] == "[":
+                self._index += 1
+        else:
+            self._open(depth, i)
+            self._scalar_depth = depth
+
+    def _open(self, depth:int, i:int):
+        if depth == 1:
+            self._starts[1] = ("key" if self._expect == "key" else (self._key,), i)
+        elif depth == 2 and self._stack[1] == "[":
+            self._starts[2] = ((self._key, self._index), i)
+
+    def _close(self, depth:int, end:int, events:list):
+        start = self._starts.pop(depth, None)
+        if start is None:
+            return
+        path, begin = start
+        try:
+            value = json.loads(self.buffer[begin:end])
+        except json.JSONDecodeError:
+            return
+        if path == "key":
+            self._key = value
+            return
+        if len(path) == 1:
+            self.result[path[0]] = value
+        events.append((path, value))
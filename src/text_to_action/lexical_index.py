@@ -0,0 +1,104 @@
+import math
+from collections import Counter
+from typing import Dict, List, Tuple
+import numpy as np
+
+
+class LexicalIndex:
+    """
+    Character n-gram TF-IDF index over short texts (action descriptions and examples).
+
+    Symbolic queries like "20+50" or "sqrt 16" share few semantics with anything but share many character
+    n-grams with the examples they were written after, so their lexical scores are reliable where the
+    embedding scores are not. Scores are cosine similarities between sublinear TF-IDF vectors, in [0, 1].
+    """
+    _DIGITS = str.maketrans("123456789", "000000000")
+
+    def __init__(self, ngram_range:Tuple[int, int]=(2, 4), fold_digits:bool=True):
+        """
+        Args:
+            ngram_range (Tuple[int, int], optional): The smallest and largest n-gram length. Defaults to (2, 4).
+            fold_digits (bool, optional): If True, all digits are treated as the same character, so "30+40" matches "20+50"
+                as well as "20+50" itself. Defaults to True.
+        """
+        self.ngram_range = tuple(ngram_range)
+        self.fold_digits = fold_digits
+        self.vocabulary:Dict[str, int] = {}
+        self.idf:np.ndarray = None
+        # Postings grouped by n-gram: the rows of n-gram j are rows[offsets[j]:offsets[j + 1]], with their weights
+        self.offsets:np.ndarray = None
+        self.rows:np.ndarray = None
+        self.weights:np.ndarray = None
+        # True for the rows that have a text
+        self.has_text:np.ndarray = None
+        self.n_rows = 0
+
+    def __str__(self):
+        return f"{self.__class__.__name__} with {len(self.vocabulary)} n-grams over {self.n_rows} rows"
+
+    def _ngrams(self, text:str)->Counter:
+        text = " " + " ".join(text.lower().split()) + " "
+        if self.fold_digits:
+            text = text.translate(self._DIGITS)
+        low, high = self.ngram_range
+        return Counter(text[i:i + n] for n in range(low, high + 1) for i in range(len(text) - n + 1))
+
+    @staticmethod
+    def _normalized(weights:np.ndarray)->np.ndarray:
+        norm = np.linalg.norm(weights)
+        return weights / norm if norm > 0 else weights
+
+    def build(self, texts:List[str]):
+        """
+        Indexes a list of texts; row i of the scores is texts[i]. Rows whose text is None never match.
+        """
+        counts = [self._ngrams(text) if text else Counter() for text in texts]
+        document_frequency = Counter(ngram for row_counts in counts for ngram in row_counts)
+        self.vocabulary = {ngram: j for j, ngram in enumerate(document_frequency)}
+        self.n_rows = len(texts)
+        self.has_text = np.array([bool(text) for text in texts], dtype=bool)
+        self.idf = np.array([math.log((1 + self.n_rows) / (1 + df)) + 1 for df in document_frequency.values()], dtype=np.float32)
+
+        columns, rows, weights = [], [], []
+        for row, row_counts in enumerate(counts):
+            if not row_counts:
+                continue
+            row_columns = np.array([self.vocabulary[ngram] for ngram in row_counts], dtype=np.int64)
+            tf = 1 + np.log(np.array(list(row_counts.values()), dtype=np.float32))
+            columns.append(row_columns)
+            rows.append(np.full(len(row_columns), row, dtype=np.int64))
+            weights.append(self._normalized(tf * self.idf[row_columns]))
+
+        columns = np.concatenate(columns) if columns else np.zeros(0, dtype=np.int64)
+        order = np.argsort(columns, kind="stable")
+        self.rows = np.concatenate(rows)[order] if rows else np.zeros(0, dtype=np.int64)
+        self.weights = np.concatenate(weights)[order].astype(np.float32) if weights else np.zeros(0, dtype=np.float32)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(columns, minlength=len(self.vocabulary)))]).astype(np.int64)
+
+    def score(self, texts:List[str])->np.ndarray:
+        """
+        Returns the (B x N) cosine similarities between the query texts and every indexed row.
+        """
+        scores = np.zeros((len(texts), self.n_rows), dtype=np.float32)
+        # N-grams that never occur in the index count with the largest idf, so unknown content lowers the score
+        unseen_idf = math.log(1 + self.n_rows) + 1
+        for i, text in enumerate(texts):
+            query_counts = self._ngrams(text)
+            if not query_counts or not self.vocabulary:
+                continue
+            columns = np.array([self.vocabulary.get(ngram, -1) for ngram in query_counts], dtype=np.int64)
+            tf = 1 + np.log(np.array(list(query_counts.values()), dtype=np.float32))
+            idf = np.where(columns >= 0, self.idf[np.maximum(columns, 0)], unseen_idf)
+            query_weights = self._normalized(tf * idf)
+
+            # Gather the postings of every known query n-gram and sum the products per row
+            known = columns >= 0
+            columns, query_weights = columns[known], query_weights[known]
+            starts = self.offsets[columns]
+            lengths = self.offsets[columns + 1] - starts
+            if lengths.sum() == 0:
+                continue
+            postings = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            products = np.repeat(query_weights, lengths) * self.weights[postings]
+            scores[i] = np.bincount(self.rows[postings], weights=products, minlength=self.n_rows)
+        return scores
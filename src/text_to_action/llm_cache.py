@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict
+from .utils import LRUCache
+
+
+class LLMResponseCache:
+    """
+    Two-tier cache of LLM responses, keyed on a hash of the model, the endpoint, the messages and the call's kwargs.
+
+    The first tier is an in-memory LRU. The optional second tier is a SQLite file, which several worker processes
+    can share (it is opened in WAL mode, so readers don't block the writer). Responses found on disk are promoted
+    to memory for the rest of their ttl. Every EVICT_INTERVAL writes, the disk tier drops its expired entries and its
+    oldest entries beyond max_disk_entries, so it can briefly hold up to EVICT_INTERVAL extra entries per process.
+    """
+    EVICT_INTERVAL = 256
+
+    def __init__(self, maxsize:int=1024, ttl:float=None, path:str=None, max_disk_entries:int=100000):
+        """
+        Args:
+            maxsize (int, optional): The number of responses kept in memory. Defaults to 1024.
+            ttl (float, optional): Seconds after which a response is stale and requested again. Defaults to None (never).
+            path (str, optional): Path of the SQLite file for the shared disk tier. Defaults to None (memory only).
+            max_disk_entries (int, optional): The number of responses kept on disk. Defaults to 100000.
+        """
+        self.memory = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self.disk_hits = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._connection = None
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            with self._connection:
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute("CREATE TABLE IF NOT EXISTS responses "
+                                         "(key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)")
+                self._connection.execute("CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)")
+
+    @staticmethod
+    def key(model:str, messages:list, kwargs:Dict[str, Any]=None, endpoint:str=None)->str:
+        """
+        Returns the cache key of an LLM call. endpoint tells apart local servers that are called without a model name.
+        """
+        payload = json.dumps({"model": model, "endpoint": endpoint, "messages": messages, "kwargs": kwargs or {}},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key:str)->str:
+        """
+        Returns the cached response, or None.
+        """
+        response = self.memory.get(key)
+        if response is not None or self._connection is None:
+            return response
+
+        with self._lock:
+            row = self._connection.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        remaining_ttl = None if row is None or self.ttl is None else row[1] + self.ttl - time.time()
+        if row is None or (remaining_ttl is not None and remaining_ttl <= 0):
+            return None
+        with self._lock:
+            self.disk_hits += 1
+        self.memory.put(key, row[0], ttl=remaining_ttl)
+        return row[0]
+
+    def put(self, key:str, response:str):
+        self.memory.put(key, response)
+        if self._connection is None:
+            return
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO responses (key, response, created_at) VALUES (?, ?, ?)",
+                                     (key, response, time.time()))
+            self._puts += 1
+            if self._puts % self.EVICT_INTERVAL == 0:
+                self._evict()
+
+    def _evict(self):
+        if self.ttl is not None:
+            self._connection.execute("DELETE FROM responses WHERE created_at <= ?", (time.time() - self.ttl,))
+        overflow = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_disk_entries
+        if overflow > 0:
+            self._connection.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY created_at "
+                                     "LIMIT ?)", (overflow,))
+
+    def clear(self):
+        """
+        Empties both tiers and resets the statistics.
+        """
+        self.memory.clear()
+        with self._lock:
+            self.disk_hits = 0
+            if self._connection is not None:
+                with self._connection:
+                    self._connection.execute("DELETE FROM responses")
+
+    def stats(self)->Dict[str, Any]:
+        """
+        Returns the hit counts per tier, the misses and the overall hit rate.
+        """
+        memory_stats = self.memory.stats()
+        requests = memory_stats["hits"] + memory_stats["misses"]
+        hits = memory_stats["hits"] + self.disk_hits
+        stats = {"memory_hits": memory_stats["hits"], "disk_hits": self.disk_hits, "misses": requests - hits,
+                 "hit_rate": hits / requests if requests else 0.0, "memory_size": memory_stats["size"]}
+        if self._connection is not None:
+            with self._lock:
+                stats["disk_size"] = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return stats
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -3,13 +3,16 @@ from dotenv import load_dotenv
 load_dotenv()
 import re
 import json
-import deepdiff
 import ast
 import inspect
+import asyncio
+import weakref
+import threading
+from collections import Counter
 from typing import get_args
 from pydantic import BaseModel
-from openai import OpenAIError, OpenAI
-from litellm import completion
+from .llm_cache import LLMResponseCache
+from .json_stream import IncrementalJSONParser
 
 class ConversationManager:
     def __init__(self, max_history=10):
@@ -50,22 +53,211 @@ class ConversationManager:
         self.conversation_history = []
 
 class LLMClient:
-    def __init__(self,  model="gpt-3.5-turbo", local_llm_endpoint=None):
+    def __init__(self,  model="gpt-3.5-turbo", local_llm_endpoint=None, cache_size=0, cache_ttl=None, cache_path=None,
+                 prompt_cache_hints=False, max_connections=20, max_keepalive_connections=10,
+                 keepalive_expiry=30.0, timeout=600.0):
         """
         Args:
             model: LLM model name. (Find supported models here: https://docs.litellm.ai/docs/providers)
             local_llm_endpoint: The endpoint/url to a offline/local LLM, if available (like llama.cpp). In that case, model can be set to None.
+            cache_size: The number of responses of get_direct_response kept in memory, keyed on (model, messages, kwargs).
+                Defaults to 0, which disables the cache. Hit rates are reported by llm_client.response_cache.stats().
+            cache_ttl: Seconds after which a cached response expires. Defaults to None (never).
+            cache_path: Path of a SQLite file that persists the cache and can be shared by several worker processes.
+                Defaults to None (memory only).
+            prompt_cache_hints: If True, requests to the local_llm_endpoint ask the server (llama.cpp) to keep the prompt's KV cache
+                ("cache_prompt"), so the next request only prefills the part after the shared prefix. Requests aren't pinned
+                to a slot: the server picks an idle slot whose cached prompt is most similar, so concurrent requests still run in parallel.
+                Defaults to False.
+            max_connections: The maximum number of connections of the pooled HTTP client, which keeps connections to the
+                local_llm_endpoint (and to remote providers called through litellm) alive between requests. Defaults to 20.
+            max_keepalive_connections: The maximum number of idle connections kept open. Defaults to 10.
+            keepalive_expiry: Seconds after which an idle connection is closed. Defaults to 30.0.
+            timeout: Seconds to wait for an LLM response. Defaults to 600.0.
+            Requests and connection reuse are reported by llm_client.connection_stats().
         """
         self.model = model
         self.endpoint = local_llm_endpoint
         self.system_role_message = None
+        self.prompt_cache_hints = prompt_cache_hints
+        self.response_cache = None
+        if cache_size > 0 or cache_path is not None:
+            self.response_cache = LLMResponseCache(maxsize=max(cache_size, 1), ttl=cache_ttl, path=cache_path)
+
+        import httpx
+        self.timeout = timeout
+        self.http_limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections,
+                                        keepalive_expiry=keepalive_expiry)
+        self._connection_counts = Counter()
+        self._connection_lock = threading.Lock()
+        self.http_client = httpx.Client(limits=self.http_limits, timeout=timeout, event_hooks={"request": [self._on_request]})
+        # (provider, api_base, api_key) -> client passed to litellm, see _litellm_client
+        self._litellm_clients = {}
+        # event loop -> (pooled httpx.AsyncClient, {client key -> client using it}); async connections can't be shared across loops
+        self._async_clients = weakref.WeakKeyDictionary()
         if local_llm_endpoint:
+            from openai import OpenAI
             self.client = OpenAI(
                 base_url=local_llm_endpoint, # server started with llama.cpp server
-                api_key = "sk-no-key-required"
+                api_key = "sk-no-key-required",
+                http_client=self.http_client,
+                timeout=timeout
             )
         return
 
+    def _get_async_clients(self):
+        # Created once per event loop, so that the connection pool is bound to the loop that uses it
+        loop = asyncio.get_running_loop()
+        if loop not in self._async_clients:
+            import httpx
+            http_client = httpx.AsyncClient(limits=self.http_limits, timeout=self.timeout,
+                                            event_hooks={"request": [self._aon_request]})
+            self._async_clients[loop] = (http_client, {})
+        return self._async_clients[loop]
+
+    def _get_async_client(self):
+        http_client, clients = self._get_async_clients()
+        if "endpoint" not in clients:
+            from openai import AsyncOpenAI
+            clients["endpoint"] = AsyncOpenAI(base_url=self.endpoint, api_key="sk-no-key-required", http_client=http_client,
+                                              timeout=self.timeout)
+        return clients["endpoint"]
+
+    def _litellm_client(self, kwargs, asynchronous=False):
+        """
+        Returns the client to pass to litellm (as client=) so that its request goes over this LLMClient's pooled connections:
+        an OpenAI SDK client for the providers litellm calls through the OpenAI SDK (openai and the OpenAI-compatible
+        providers, e.g. groq), a litellm HTTP handler for the others. Returns None for Azure, whose SDK client litellm
+        configures itself.
+        """
+        import litellm
+        _, provider, api_key, api_base = litellm.get_llm_provider(model=self.model,
+                                                                   custom_llm_provider=kwargs.get("custom_llm_provider"),
+                                                                   api_base=kwargs.get("api_base"), api_key=kwargs.get("api_key"))
+        if provider.startswith("azure"):
+            return None
+        if asynchronous:
+            http_client, clients = self._get_async_clients()
+        else:
+            http_client, clients = self.http_client, self._litellm_clients
+
+        api_key = kwargs.get("api_key") or api_key
+        api_base = kwargs.get("api_base") or api_base
+        key = (provider, api_base, api_key)
+        if key not in clients:
+            if provider == "openai" or provider in litellm.openai_compatible_providers:
+                from openai import OpenAI, AsyncOpenAI
+                client_type = AsyncOpenAI if asynchronous else OpenAI
+                # Without an explicit key, the OpenAI SDK reads OPENAI_API_KEY like litellm does
+                clients[key] = client_type(api_key=api_key, base_url=api_base, http_client=http_client, timeout=self.timeout)
+            else:
+                from litellm.llms.custom_httpx.http_handler import HTTPHandler, AsyncHTTPHandler
+                clients[key] = AsyncHTTPHandler(client=http_client) if asynchronous else HTTPHandler(client=http_client)
+        return clients[key]
+
+    def _on_request(self, request):
+        # httpcore reports each new TCP connection and TLS handshake to the "trace" callback, reused connections skip them
+        request.extensions["trace"] = self._trace
+        self._count_connection_event("requests")
+
+    async def _aon_request(self, request):
+        request.extensions["trace"] = self._atrace
+        self._count_connection_event("requests")
+
+    def _trace(self, event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            self._count_connection_event("connections_opened")
+        elif event_name == "connection.start_tls.complete":
+            self._count_connection_event("tls_handshakes")
+
+    async def _atrace(self, event_name, info):
+        self._trace(event_name, info)
+
+    def _count_connection_event(self, event:str):
+        with self._connection_lock:
+            self._connection_counts[event] += 1
+
+    def connection_stats(self):
+        """
+        Returns the number of HTTP requests sent through the pooled clients, the new connections and TLS handshakes they needed,
+        and the share of requests that reused a kept-alive connection.
+        """
+        with self._connection_lock:
+            requests = self._connection_counts["requests"]
+            opened = self._connection_counts["connections_opened"]
+            tls_handshakes = self._connection_counts["tls_handshakes"]
+        return {"requests": requests, "connections_opened": opened, "tls_handshakes": tls_handshakes,
+                "connection_reuse_rate": max(requests - opened, 0) / requests if requests else 0.0}
+
+    def close(self):
+        """
+        Closes the pooled connections.
+        """
+        self._litellm_clients.clear()
+        self.http_client.close()
+        if self.response_cache is not None:
+            self.response_cache.close()
+
+    async def aclose(self):
+        """
+        Closes the pooled connections of the sync client and of the async client of the running event loop.
+        """
+        clients = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if clients is not None:
+            await clients[0].aclose()
+        self.close()
+
+    def _completion(self, messages, **kwargs):
+        """
+        Sends a chat completion request over the pooled connections: through the OpenAI client for a local_llm_endpoint,
+        through litellm otherwise.
+        """
+        if self.endpoint:
+            return self.client.chat.completions.create(
+                    messages=messages,
+                    model=self.model or "local",
+                    **self._with_cache_hints(messages, kwargs)
+                )
+        from litellm import completion
+        return completion(
+                    messages=messages,
+                    model=self.model,
+                    client=self._litellm_client(kwargs),
+                    **kwargs
+                )
+
+    async def _acompletion(self, messages, **kwargs):
+        """
+        Async variant of _completion.
+        """
+        if self.endpoint:
+            return await self._get_async_client().chat.completions.create(
+                    messages=messages,
+                    model=self.model or "local",
+                    **self._with_cache_hints(messages, kwargs)
+                )
+        from litellm import acompletion
+        return await acompletion(
+                    messages=messages,
+                    model=self.model,
+                    client=self._litellm_client(kwargs, asynchronous=True),
+                    **kwargs
+                )
+
+    def _cache_key(self, messages, kwargs):
+        # Streamed responses are consumed by the caller, so they can't be cached
+        if self.response_cache is None or kwargs.get("stream"):
+            return None
+        return LLMResponseCache.key(self.model, messages, kwargs, endpoint=self.endpoint)
+
+    def _with_cache_hints(self, messages, kwargs):
+        """
+        Returns the request kwargs with the local server's prompt cache hints added, if enabled.
+        """
+        if not (self.endpoint and self.prompt_cache_hints):
+            return kwargs
+        return dict(kwargs, extra_body=dict({"cache_prompt": True}, **kwargs.get("extra_body", {})))
+
     def get_direct_response(self, messages, **kwargs):
         """
         Get a response from the LLM API using pre-formatted messages for the LLM API call
@@ -78,13 +270,105 @@ class LLMClient:
             ### Using pre-formatted messages
             response = llm_client.get_direct_response(query_text="Hello", messages=[{"role": "user", "content": "Hello"}])
         """
-        response = completion(
-                    messages=messages,
-                    model=self.model,
-                    **kwargs
-                )
-        return response.choices[0].message.content
+        cache_key = self._cache_key(messages, kwargs)
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        response = self._completion(messages, **kwargs)
+        content = response.choices[0].message.content
+        if cache_key is not None and content is not None:
+            self.response_cache.put(cache_key, content)
+        return content
+
+    async def aget_direct_response(self, messages, **kwargs):
+        """
+        Same as get_direct_response, without blocking the event loop during the LLM round trip.
+
+        Examples:
+            response = await llm_client.aget_direct_response(messages=[{"role": "user", "content": "Hello"}])
+        """
+        cache_key = self._cache_key(messages, kwargs)
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        response = await self._acompletion(messages, **kwargs)
+        content = response.choices[0].message.content
+        if cache_key is not None and content is not None:
+            self.response_cache.put(cache_key, content)
+        return content
     
+    def stream_direct_response(self, messages, **kwargs):
+        """
+        Same as get_direct_response, but yields the content of the response in chunks while the LLM generates it.
+        A cached response is yielded as one chunk, and a completed response is added to the cache.
+
+        Examples:
+            for chunk in llm_client.stream_direct_response(messages=[{"role": "user", "content": "Hello"}]):
+                print(chunk, end="")
+        """
+        cache_key = self._cache_key(messages, kwargs)
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        response = self._completion(messages, stream=True, **kwargs)
+        content = []
+        for chunk in response:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                content.append(delta)
+                yield delta
+        if cache_key is not None and content:
+            self.response_cache.put(cache_key, "".join(content))
+
+    async def astream_direct_response(self, messages, **kwargs):
+        """
+        Async variant of stream_direct_response.
+        """
+        cache_key = self._cache_key(messages, kwargs)
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        response = await self._acompletion(messages, stream=True, **kwargs)
+        content = []
+        async for chunk in response:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                content.append(delta)
+                yield delta
+        if cache_key is not None and content:
+            self.response_cache.put(cache_key, "".join(content))
+
+    def stream_json_response(self, messages, **kwargs):
+        """
+        Streams a JSON object response and yields (path, value) for each value as soon as it is complete
+        (see IncrementalJSONParser), e.g. (("actions", 0), "resize image to 300x300").
+        The last item is ((), response), the whole response parsed with extract_json_from_response.
+        """
+        parser = IncrementalJSONParser()
+        for chunk in self.stream_direct_response(messages, **kwargs):
+            yield from parser.feed(chunk)
+        yield (), extract_json_from_response(parser.buffer)
+
+    async def astream_json_response(self, messages, **kwargs):
+        """
+        Async variant of stream_json_response.
+        """
+        parser = IncrementalJSONParser()
+        async for chunk in self.astream_direct_response(messages, **kwargs):
+            for event in parser.feed(chunk):
+                yield event
+        yield (), extract_json_from_response(parser.buffer)
+
     def get_response(self, query_text, conversation_manager: ConversationManager, include_history=False, **kwargs):
             """
             Get a response from the LLM API using a conversation manager to handle message history and formatting.
@@ -116,6 +400,9 @@ class LLMClient:
             """
 
 
+            from litellm import completion
+            from openai import OpenAIError
+
             conversation_manager.add_to_history(role="user", content=query_text)
             messages = conversation_manager.get_messages(include_history=include_history)
 
@@ -124,6 +411,7 @@ class LLMClient:
                 response = completion(
                     messages=messages,
                     model=self.model,
+                    client=self._litellm_client(kwargs),
                     **kwargs
                 )
 
@@ -141,6 +429,7 @@ def create_instance(class_name: str, params: dict, param_type):
     raise ValueError(f"Class name mismatch: expected {param_type.__name__}, got {class_name}")     
 
 def are_objects_equal(json1, json2):
+    import deepdiff
     diff = deepdiff.DeepDiff(json1, json2, ignore_order=True)
     return not bool(diff)
 
@@ -237,6 +526,39 @@ def extract_json_from_response(response: str):
     # If all attempts fail, return None or raise an error
     return None
 
+EXTRACT_PARAMETERS_SYSTEM_MESSAGE = """
+    You are a helpful assistant that analyzes text to extract parameters for functions. You will be provided with the text, function name and its input parameters.
+    Your task is to process the information provided and return the relevant parameter values in a specific JSON format.
+    Extract the values for each parameter and only return a JSON object where the keys are the parameter names and the values are the extracted values.
+    For List types, provide a list of values.
+    For complex types (like Pydantic models), provide a dictionary with the field names as keys.
+    If a value for a parameter is not found, omit it from the JSON.
+    Strictly return JSON object to ensure correct formatting so that I can directly do json.loads().
+
+    Expected JSON output format:
+    {
+        "param_name1": value1,
+        "param_name2": [value2a, value2b],
+        "param_name3": {"field1": value3a, "field2": value3b}
+    }
+    """
+
+EXTRACT_ACTIONS_PARAMETERS_SYSTEM_MESSAGE = """
+    You are a helpful assistant that analyzes text to extract parameters for functions. You will be provided with the text and several function names with their input parameters.
+    Your task is to process the information provided and return the relevant parameter values of every function in a specific JSON format.
+    Only return a JSON object where the keys are the function names and each value is a JSON object whose keys are that function's parameter names and whose values are the extracted values.
+    For List types, provide a list of values.
+    For complex types (like Pydantic models), provide a dictionary with the field names as keys.
+    If a value for a parameter is not found, omit it from that function's JSON object.
+    Strictly return JSON object to ensure correct formatting so that I can directly do json.loads().
+
+    Expected JSON output format:
+    {
+        "function_name1": {"param_name1": value1, "param_name2": [value2a, value2b]},
+        "function_name2": {"param_name1": {"field1": value1a, "field2": value1b}}
+    }
+    """
+
 def llm_extract_all_parameters(function_name, query_text,llm_client:LLMClient,args_dict=None):
     """
     Extract all parameters for a given function using an LLM and map them to correct kwargs.
@@ -249,8 +571,20 @@ def llm_extract_all_parameters(function_name, query_text,llm_client:LLMClient,ar
         A JSON string containing the extracted parameters mapped to their correct kwargs.
     """
 
+    messages = _extract_all_parameters_messages(function_name, query_text, args_dict)
+    llm_response = llm_client.get_direct_response(messages=messages)
+    return _parse_extracted_parameters(llm_response, function_name, args_dict)
+
+async def allm_extract_all_parameters(function_name, query_text,llm_client:LLMClient,args_dict=None):
+    """
+    Same as llm_extract_all_parameters, awaiting the LLM call.
+    """
+    messages = _extract_all_parameters_messages(function_name, query_text, args_dict)
+    llm_response = await llm_client.aget_direct_response(messages=messages)
+    return _parse_extracted_parameters(llm_response, function_name, args_dict)
+
+def _extract_all_parameters_messages(function_name, query_text, args_dict=None):
     if args_dict is None:
-        sig = inspect.signature(function_name)
         param_dict, type_descriptions = get_param_details(function_name)
         prompt_intro = f"""Analyze the following text to extract parameters for the function "{function_name}".
         The function takes the following parameters:
@@ -271,29 +605,11 @@ def llm_extract_all_parameters(function_name, query_text,llm_client:LLMClient,ar
     "{query_text}"
 
     """
-    system_message = f"""
-    You are a helpful assistant that analyzes text to extract parameters for functions. You will be provided with the text, function name and its input parameters.
-    Your task is to process the information provided and return the relevant parameter values in a specific JSON format.
-    Extract the values for each parameter and only return a JSON object where the keys are the parameter names and the values are the extracted values.
-    For List types, provide a list of values.
-    For complex types (like Pydantic models), provide a dictionary with the field names as keys.
-    If a value for a parameter is not found, omit it from the JSON.
-    Strictly return JSON object to ensure correct formatting so that I can directly do json.loads().
-
-    Expected JSON output format:
-    {{
-        "param_name1": value1,
-        "param_name2": [value2a, value2b],
-        "param_name3": {{"field1": value3a, "field2": value3b}}
-    }}
-    """
-
-
-    # Send prompt to LLM and get the response
-    messages = [{ "content": prompt,"role": "user"},
-                {"role":"system","content": system_message}]
-    llm_response = llm_client.get_direct_response(messages=messages)
+    # Static instructions first and the query text last, so requests share the longest possible prefix
+    return [{"role":"system","content": EXTRACT_PARAMETERS_SYSTEM_MESSAGE},
+            {"role": "user", "content": prompt}]
 
+def _parse_extracted_parameters(llm_response, function_name, args_dict=None):
     #   Parse the response from the llm
     try:
         extracted_params = extract_json_from_response(llm_response)
@@ -306,6 +622,7 @@ def llm_extract_all_parameters(function_name, query_text,llm_client:LLMClient,ar
         return "{}"
 
     # Validate and convert the extracted parameters
+    sig = inspect.signature(function_name)
     validated_params = {}
     for param_name, param in sig.parameters.items():
         if param_name in extracted_params:
@@ -324,6 +641,51 @@ def llm_extract_all_parameters(function_name, query_text,llm_client:LLMClient,ar
     return validated_params
     
 
+def llm_extract_parameters_for_actions(query_text, actions_args, llm_client:LLMClient):
+    """
+    Extract the parameters of several functions with a single LLM call.
+
+    Args:
+        query_text: The input text to analyze for parameter extraction.
+        actions_args: A dictionary mapping each function name to its parameter names and types, e.g. {"add": {"a": "int", "b": "int"}}.
+    Returns:
+        A dictionary mapping function names to their extracted parameters. Functions the LLM didn't return a JSON object for are omitted.
+    """
+    messages = _extract_parameters_for_actions_messages(query_text, actions_args)
+    llm_response = llm_client.get_direct_response(messages=messages)
+    return _parse_parameters_for_actions(llm_response, actions_args)
+
+async def allm_extract_parameters_for_actions(query_text, actions_args, llm_client:LLMClient):
+    """
+    Same as llm_extract_parameters_for_actions, awaiting the LLM call.
+    """
+    messages = _extract_parameters_for_actions_messages(query_text, actions_args)
+    llm_response = await llm_client.aget_direct_response(messages=messages)
+    return _parse_parameters_for_actions(llm_response, actions_args)
+
+def _extract_parameters_for_actions_messages(query_text, actions_args):
+    prompt = f"""
+    Analyze the following text to extract parameters for each of these functions.
+    The functions and the parameters they take:
+    {json.dumps(actions_args, indent=2)}
+
+    Text to analyze:
+
+    "{query_text}"
+
+    """
+
+    return [{"role":"system","content": EXTRACT_ACTIONS_PARAMETERS_SYSTEM_MESSAGE},
+            {"role": "user", "content": prompt}]
+
+def _parse_parameters_for_actions(llm_response, actions_args):
+    extracted = extract_json_from_response(llm_response) if llm_response else None
+    if not isinstance(extracted, dict):
+        print("Error: LLM response is not valid JSON")
+        return {}
+    return {function: params for function, params in extracted.items() if function in actions_args and isinstance(params, dict)}
+
+
 def llm_extract_parameters(text: str, param_type,llm_client:LLMClient):
     """
     Extract parameters from the text using an LLM and initialize respective class.
@@ -3,13 +3,75 @@ from pathlib import Path
 import sys
 import os
 import json
+import asyncio
+import inspect
+import threading
+import concurrent.futures
+from collections import Counter
 from typing import Any, Dict, Union, List, Tuple
-from .vector_emb import VectorStore, ModelSource
+from .types import ModelSource, IndexType, EmbeddingDType
 from .entity_models import *
 from .utils import verbose_print,Config
 from .extract_parameters import NERParameterExtractor,LLMParameterExtractor
 from .llm_utils import LLMClient, extract_json_from_response
 
+FILTER_INSTRUCTIONS = """ Please strictly follow these instructions to handle them:
+            Output format:
+                Strictly return only a JSON response with only "actions" and "message" fields.
+
+            If the input is a unrelated message (e.g., "Hi", "How are you?", "What's up?"), respond politely and return the following JSON:
+
+            {
+            "actions": [],
+            "message": <General message or greeting>
+            }
+
+            But if the input contains a task or action:
+
+            Refine the input by removing irrelevant parts.
+            For multiple tasks or actions (e.g., "Hello there. Can you resize the image to 300x300 and send it via email?"), break them down into individual tasks.
+            Pass the refined input to the text-to-action software.
+
+            Return a JSON response with the actions.
+            Output Structure:
+
+            If no actions are found:
+
+            {
+            "actions": [],
+            "message": <Sorry I cannot perform that action as of now!>
+            }
+
+            If actions/functions are found:
+
+            {
+                "actions": [action1_description, action2_description],
+                message: "<relevant message>"
+            }
+            Examples:
+
+            Input: "Hi"
+            Output:
+            {
+            "actions": [],
+            "message": hello
+            }
+
+            Input: "Hi!. Can you resize the image to 300x300?"
+            Output:
+            {
+            "actions": ["resize image to 300x300" ],
+            "message": "Hello there. Sure I can help you with that."
+            }
+
+            Input: "Can you resize the image to 300x300 and add brightness?"
+            Output:
+            {
+            "actions": ["resize image to 300x300", "increase brightness"],
+            "message": "Detected multiple actions."
+            }
+        """
+
 def load_module_from_path(file_path:str):
     file_path = Path(file_path)
     module_name = file_path.stem  # Use the file name without extension as the module name
@@ -35,6 +97,21 @@ class TextToAction:
                 spacy_model_ner="en_core_web_trf",
                 embedding_model="all-MiniLM-L6-v2",
                 model_source=ModelSource.SBERT,
+                index_type=IndexType.EXACT,
+                index_params=None,
+                query_cache_size=0,
+                storage_dtype: EmbeddingDType = None,
+                micro_batch_wait_ms: float = None,
+                micro_batch_size=32,
+                embeddings_store=None,
+                namespace: str = None,
+                lexical_weight=0.0,
+                lexical_threshold: float = None,
+                filter_bypass_score: float = None,
+                filter_bypass_margin=0.1,
+                max_concurrent_extractions=4,
+                combined_extraction=False,
+                stream_filter=False,
                 verbose_output=False):
         """
         Initializes the class for Text-to-Action functionality.
@@ -52,24 +129,63 @@ class TextToAction:
             spacy_model_ner (str): Name of the spaCy model to use for Named Entity Recognition (NER) during parameter extraction. Default is "en_core_web_trf".
             embedding_model (str): Identifier for the embedding model to use. Ensure it matches the model used for creating embeddings (Default: "all-MiniLM-L6-v2").
             model_source (ModelSource): Source of the embedding model. Default is `ModelSource.SBERT`.
+            index_type (IndexType): `IndexType.EXACT` scans every example per query. `IndexType.IVF` uses an approximate nearest-neighbor index, loaded from next to the embeddings file or built on the first query. Default is `IndexType.EXACT`.
+            index_params (dict): Keyword arguments for the index, e.g. {"n_probe": 8}. Default is None.
+            query_cache_size (int): The number of query embeddings to keep in an LRU cache, so repeated queries skip the embedding model. Hit/miss counts are available from `embeddings_store.query_cache.stats()`. 0 disables the cache. Default is 0.
+            storage_dtype (EmbeddingDType): Precision in which the action embeddings are kept in memory (`FLOAT32`, `FLOAT16` or `INT8`). Default is None, which keeps the precision of the embeddings file.
+            micro_batch_wait_ms (float): If set, queries from concurrent callers (threads or asyncio tasks) are queued for up to this many milliseconds and encoded in one batch. Batch sizes and queueing delays are available from `embeddings_store.batcher.stats()`. Default is None, which encodes every query directly.
+            micro_batch_size (int): The maximum number of queries encoded in one batch when `micro_batch_wait_ms` is set. Default is 32.
+            embeddings_store (VectorStore): An existing store to share with other `TextToAction` instances, e.g. one per product, so the embedding model, matrix and index are loaded once. The embedding, index and cache options above are then ignored. Default is None, which creates a new store.
+            namespace (str): The catalog name under which the actions are added to the store (see `VectorStore.add_catalog`). Only this catalog's actions are matched, so instances sharing a store can't see each other's actions. If the store already has this catalog, it is reused as-is. Default is None, which loads the embeddings into the store without a namespace.
+            lexical_weight (float): Weight of the character n-gram score of the descriptions/examples in the score of each example, which helps short symbolic queries like "20+50". Needs an embeddings file created with the descriptions and examples saved in it. Default is 0.0 (semantic scores only).
+            lexical_threshold (float): Queries whose best character n-gram score reaches this value are matched on lexical scores alone, without running the embedding model. Default is None (every query is embedded).
+            filter_bypass_score (float): With `filter_input`, retrieval runs first, and the LLM filter is skipped when the top action scores at least this much and beats the runner-up by `filter_bypass_margin`. The decisions are counted in `routing_stats()`. Default is None, which always calls the filter.
+            filter_bypass_margin (float): The minimum score difference between the top action and the runner-up for skipping the filter. Default is 0.1.
+            max_concurrent_extractions (int): The maximum number of detected actions whose parameters are extracted at the same time in `extract_actions_with_args`, so a multi-action query costs about one LLM round trip instead of one per action. Extractors that aren't thread-safe (NER) always run one action at a time. 1 disables concurrency. Default is 4.
+            combined_extraction (bool): If True, the parameters of all actions detected in a query are extracted with a single LLM call that returns one JSON object keyed by action name. Actions whose parameters are missing or incomplete in that response are extracted with their own call. Default is False.
+            stream_filter (bool): With `filter_input`, `extract_actions_with_args` streams the filter response, and retrieves each refined action and starts extracting its parameters as soon as the filter has generated it, while the rest of the response is still being generated. Default is False.
             verbose_output (bool): If True, additional details and messages will be printed for debugging and verbosity. Default is False.
 
         """
 
-        self.embeddings_store = VectorStore(embedding_model=embedding_model,
-                                                      model_source =model_source)
+        if embeddings_store is None:
+            # Imported here so that importing the package doesn't load torch and the embedding libraries
+            from .vector_emb import VectorStore
+            embeddings_store = VectorStore(embedding_model=embedding_model,
+                                           model_source =model_source,
+                                           index_type=index_type,
+                                           index_params=index_params,
+                                           query_cache_size=query_cache_size,
+                                           storage_dtype=storage_dtype,
+                                           micro_batch_wait_ms=micro_batch_wait_ms,
+                                           micro_batch_size=micro_batch_size,
+                                           lexical_weight=lexical_weight)
+        self.embeddings_store = embeddings_store
+        self.namespace = namespace
+        self.lexical_threshold = lexical_threshold
+        self.filter_bypass_score = filter_bypass_score
+        self.filter_bypass_margin = filter_bypass_margin
+        self._routing_counts = Counter()
+        self._routing_lock = threading.Lock()
+        self.max_concurrent_extractions = max(1, max_concurrent_extractions)
+        self.combined_extraction = combined_extraction
+        self.stream_filter = stream_filter
         self.llm_client = llm_client
         self.parameter_extractor = LLMParameterExtractor(llm_client) if use_llm_extract_parameters else NERParameterExtractor(spacy_model_ner,llm_client)
 
         if actions_folder:
             action_embeddings_filepath, action_descriptions_filepath, action_implementation_filepath = self.validate_file_paths(actions_folder)
 
-        self.embeddings_store.load(action_embeddings_filepath)
+        if namespace is None:
+            self.embeddings_store.load(action_embeddings_filepath)
+        elif namespace not in self.embeddings_store.catalogs:
+            self.embeddings_store.add_catalog(namespace, action_embeddings_filepath)
         self.actions_module = load_module_from_path(action_implementation_filepath) if action_implementation_filepath is not None else None
 
         self.load_args_from_json(action_descriptions_filepath)
         
         self.application_context = application_context
+        self._filter_system_message = None
         self.filter_input = filter_input
         Config.set_verbose(verbose_output)
 
@@ -112,65 +228,28 @@ class TextToAction:
 
         Returns a dictionary
         """
-        system_message = "You are an assistant for a Text to Action software. You will receive various user inputs about performing different "+ self.application_context + """ tasks. Please strictly follow these instructions to handle them:
-            Output format:
-                Strictly return only a JSON response with only "actions" and "message" fields.
-
-            If the input is a unrelated message (e.g., "Hi", "How are you?", "What's up?"), respond politely and return the following JSON:
-
-            {
-            "actions": [],
-            "message": <General message or greeting>
-            }
-
-            But if the input contains a task or action:
-
-            Refine the input by removing irrelevant parts.
-            For multiple tasks or actions (e.g., "Hello there. Can you resize the image to 300x300 and send it via email?"), break them down into individual tasks.
-            Pass the refined input to the text-to-action software.
-
-            Return a JSON response with the actions.
-            Output Structure:
-
-            If no actions are found:
-
-            {
-            "actions": [],
-            "message": <Sorry I cannot perform that action as of now!>
-            }
-
-            If actions/functions are found:
-
-            {
-                "actions": [action1_description, action2_description],
-                message: "<relevant message>"
-            }
-            Examples:
-
-            Input: "Hi"
-            Output:
-            {
-            "actions": [],
-            "message": hello
-            }
+        response = self.llm_client.get_direct_response(messages=self._filter_messages(query_text))
+        return self._parse_filter_response(response)
 
-            Input: "Hi!. Can you resize the image to 300x300?"
-            Output:
-            {
-            "actions": ["resize image to 300x300" ],
-            "message": "Hello there. Sure I can help you with that."
-            }
-
-            Input: "Can you resize the image to 300x300 and add brightness?"
-            Output:
-            {
-            "actions": ["resize image to 300x300", "increase brightness"],
-            "message": "Detected multiple actions."
-            }
+    async def afilter_user_query(self, query_text):
         """
+        Async variant of filter_user_query.
+        """
+        response = await self.llm_client.aget_direct_response(messages=self._filter_messages(query_text))
+        return self._parse_filter_response(response)
+
+    def _filter_messages(self, query_text):
+        # The system prompt only depends on the application context, so it's built once and every request starts
+        # with the same prefix, which provider prompt caching and llama.cpp's prompt cache can reuse
+        if self._filter_system_message is None or self._filter_system_message[0] != self.application_context:
+            system_message = "You are an assistant for a Text to Action software. You will receive various user inputs about performing different "+ self.application_context + " tasks." + FILTER_INSTRUCTIONS
+            self._filter_system_message = (self.application_context, system_message)
 
         # response_format= { "type": "json_schema", "json_schema": {"actions":'List',"message":str} , "strict": True }
-        response = self.llm_client.get_direct_response(messages=[{"role":"system","content":system_message},{"role":"user","content":query_text}])
+        return [{"role":"system","content":self._filter_system_message[1]},{"role":"user","content":query_text}]
+
+    @staticmethod
+    def _parse_filter_response(response):
         format_response = extract_json_from_response(response)
         verbose_print("Filtered query:", format_response)
         return format_response
@@ -190,8 +269,21 @@ class TextToAction:
         except Exception as e:
             print(f"Error executing action: {e}")
             return None
+
+    async def aexecute_action(self, action_name: Union[callable, str], extracted_parameters: Dict[str, Any]) -> Any:
+        """
+        Async variant of execute_action. Actions implemented as coroutine functions are awaited.
+        """
+        result = self.execute_action(action_name, extracted_parameters)
+        if inspect.isawaitable(result):
+            try:
+                return await result
+            except Exception as e:
+                print(f"Error executing action: {e}")
+                return None
+        return result
     
-    def extract_actions(self, query_text, top_k=1, threshold=0.45)-> Dict[str,Any]:
+    def extract_actions(self, query_text, top_k=1, threshold=0.45, pooling="max")-> Dict[str,Any]:
         """
         Get top matched actions.
         **This doesnt actually execute the action. It just returns the list of top ranked action.**
@@ -200,43 +292,154 @@ class TextToAction:
             query_text : The text input.
             top_k : The number of top-ranked actions to consider. (Default: 1)
             threshold : The threshold value for action selection. (Default: 0.45)
+            pooling : How the scores of an action's examples are combined: "max" or "mean". top_k distinct actions are returned per (sub-)query.
+                      If None, the top_k examples are retrieved instead and deduplicated by action. Lexical scores are only used with pooling. (Default: "max")
 
          Returns:
             Dict[str, Any]: A dictionary containing:
                 - "actions" (List[str]): A list of actions
                 - "message" (str): A message describing the status of the action extraction.
         """
-        possible_actions = []
-        actions = []
-        message = ""
+        if len(query_text.strip())==0:
+            return {"actions": [], "message": "Empty text cannot be processed."}
+
+        queries = [query_text]
+        response = None
+        confident_hits = None
+        if self.filter_input:
+            confident_hits = self._confident_actions(query_text, top_k, pooling)
+            if confident_hits is None:
+                response = self.filter_user_query(query_text)
+            if response is not None and len(response["actions"])==0:
+                return response
+            elif response is not None:
+                queries = response["actions"]
+
+        possible_actions = self._retrieve_actions(queries, confident_hits, top_k, threshold, pooling)
+        return self._actions_result(possible_actions, response)
 
+    async def aextract_actions(self, query_text, top_k=1, threshold=0.45, pooling="max")-> Dict[str,Any]:
+        """
+        Async variant of extract_actions. The LLM filter and the query encoding are awaited and the scoring runs in a
+        worker thread, so the event loop is never blocked.
+        """
         if len(query_text.strip())==0:
-            return {"actions": actions, "message": "Empty text cannot be processed."}
+            return {"actions": [], "message": "Empty text cannot be processed."}
 
+        queries = [query_text]
+        response = None
+        confident_hits = None
         if self.filter_input:
-            response = self.filter_user_query(query_text)
-            if response is None:
-                possible_actions.extend(self.embeddings_store.query(query_text, k=top_k))
-            elif len(response["actions"])==0:
+            confident_hits = await self._aconfident_actions(query_text, top_k, pooling)
+            if confident_hits is None:
+                response = await self.afilter_user_query(query_text)
+            if response is not None and len(response["actions"])==0:
                 return response
-            else:
-                for query in response["actions"]:
-                    possible_actions.extend(self.embeddings_store.query(query, k=top_k))
+            elif response is not None:
+                queries = response["actions"]
+
+        possible_actions = await self._aretrieve_actions(queries, confident_hits, top_k, threshold, pooling)
+        return self._actions_result(possible_actions, response)
+
+    def _retrieve_actions(self, queries, confident_hits=None, top_k=1, threshold=0.45, pooling="max")->List[Tuple[str, float]]:
+        """
+        Returns the (action name, score) pairs above the threshold for the queries, or from confident_hits if the filter was skipped.
+        """
+        possible_actions = []
+        if confident_hits is not None:
+            possible_actions.extend((action_name, score) for action_name, score in confident_hits[:top_k] if score > threshold)
+        elif pooling is None:
+            for hits in self.embeddings_store.query_batch(queries, k=top_k, namespaces=self.namespace):
+                possible_actions.extend((node.id_name, score) for node, score in hits if score > threshold)
         else:
-            possible_actions.extend(self.embeddings_store.query(query_text, k=top_k))
+            for hits in self.embeddings_store.query_actions_batch(queries, k=top_k, threshold=threshold, pooling=pooling,
+                                                                 namespaces=self.namespace, lexical_threshold=self.lexical_threshold):
+                possible_actions.extend(hits)
+        return possible_actions
 
-        
-        for action in possible_actions:
-            if action[1] > threshold and action[0].id_name not in actions:
-                actions.append(action[0].id_name)
+    async def _aretrieve_actions(self, queries, confident_hits=None, top_k=1, threshold=0.45, pooling="max")->List[Tuple[str, float]]:
+        """
+        Async variant of _retrieve_actions.
+        """
+        possible_actions = []
+        if confident_hits is not None:
+            possible_actions.extend((action_name, score) for action_name, score in confident_hits[:top_k] if score > threshold)
+        elif pooling is None:
+            for hits in await self.embeddings_store.aquery_batch(queries, k=top_k, namespaces=self.namespace):
+                possible_actions.extend((node.id_name, score) for node, score in hits if score > threshold)
+        else:
+            for hits in await self.embeddings_store.aquery_actions_batch(queries, k=top_k, threshold=threshold, pooling=pooling,
+                                                                        namespaces=self.namespace, lexical_threshold=self.lexical_threshold):
+                possible_actions.extend(hits)
+        return possible_actions
+
+    def _actions_result(self, possible_actions, response=None)->Dict[str,Any]:
+        actions = []
+        for action_name, _ in possible_actions:
+            if action_name not in actions:
+                actions.append(action_name)
 
-        if self.filter_input and response is not None:
+        if response is not None:
             message = response["message"]
         else:
             message = "Actions detected." if len(possible_actions) > 0 else "Sorry I cannot help you with that. No actions were detected."
 
         return {"actions": actions, "message": message}
 
+    def _confident_actions(self, query_text, top_k=1, pooling="max"):
+        """
+        Retrieves the actions for the raw query and returns them if the top action is confident enough to skip the LLM filter
+        (see filter_bypass_score and filter_bypass_margin), otherwise None.
+        """
+        if self.filter_bypass_score is None:
+            self._count_routing("filter_called")
+            return None
+
+        hits = self.embeddings_store.query_actions(query_text, k=max(top_k, 2), pooling=pooling or "max",
+                                                   namespaces=self.namespace, lexical_threshold=self.lexical_threshold)
+        return self._bypass_hits(hits)
+
+    async def _aconfident_actions(self, query_text, top_k=1, pooling="max"):
+        """
+        Async variant of _confident_actions.
+        """
+        if self.filter_bypass_score is None:
+            self._count_routing("filter_called")
+            return None
+
+        hits = await self.embeddings_store.aquery_actions(query_text, k=max(top_k, 2), pooling=pooling or "max",
+                                                          namespaces=self.namespace, lexical_threshold=self.lexical_threshold)
+        return self._bypass_hits(hits)
+
+    def _bypass_hits(self, hits):
+        """
+        Returns the hits if the top action is confident enough to skip the LLM filter, otherwise None.
+        """
+        top_score = hits[0][1] if hits else float("-inf")
+        runner_up_score = hits[1][1] if len(hits) > 1 else 0.0
+        if top_score >= self.filter_bypass_score and top_score - runner_up_score >= self.filter_bypass_margin:
+            verbose_print(f"Skipping the filter: {hits[0][0]} scored {top_score:.3f}, runner-up {runner_up_score:.3f}")
+            self._count_routing("filter_bypassed")
+            return hits
+
+        self._count_routing("filter_called")
+        return None
+
+    def _count_routing(self, decision:str):
+        with self._routing_lock:
+            self._routing_counts[decision] += 1
+
+    def routing_stats(self)->Dict[str, Any]:
+        """
+        Returns how many queries went through the LLM filter and how many skipped it, i.e. LLM calls avoided.
+        """
+        with self._routing_lock:
+            called = self._routing_counts["filter_called"]
+            bypassed = self._routing_counts["filter_bypassed"]
+        total = called + bypassed
+        return {"filter_called": called, "filter_bypassed": bypassed, "llm_calls_avoided": bypassed,
+                "bypass_rate": bypassed / total if total else 0.0}
+
     def extract_parameters(self, query_text, action_name, args=None)->Dict[str,Any]:
         """
         Get the parameters for the action/actions to be called.
@@ -252,23 +455,39 @@ class TextToAction:
         Returns: results : The extracted parameters for the function.
         """
         
-        if args or self.args_template.get(action_name):
-            self.parameter_extractor.clear()
-
-            # Extract the arguments for the specified function
-            if not args:
-                args = self.args_template[action_name]["args"]
-
-            if len(args)==0:
-                return {}
-            # Create the formatted string
-            formatted_args = {key: value['type'] for key, value in args.items()}
-            results = self.parameter_extractor.extract_parameters(query_text=query_text, 
-                                                                        function_name=action_name,
-                                                                        arguments_dict={action_name:formatted_args})
-            return results
-        else:
+        formatted_args = self._formatted_args(action_name, args)
+        if formatted_args is None:
             return {}
+        self.parameter_extractor.clear()
+        results = self.parameter_extractor.extract_parameters(query_text=query_text,
+                                                                    function_name=action_name,
+                                                                    arguments_dict={action_name:formatted_args})
+        return results
+
+    async def aextract_parameters(self, query_text, action_name, args=None)->Dict[str,Any]:
+        """
+        Async variant of extract_parameters.
+        """
+        formatted_args = self._formatted_args(action_name, args)
+        if formatted_args is None:
+            return {}
+        self.parameter_extractor.clear()
+        return await self.parameter_extractor.aextract_parameters(query_text=query_text,
+                                                                  function_name=action_name,
+                                                                  arguments_dict={action_name:formatted_args})
+
+    def _formatted_args(self, action_name, args=None):
+        """
+        Returns the argument types to extract for an action, or None if there is nothing to extract.
+        """
+        if not (args or self.args_template.get(action_name)):
+            return None
+        # Extract the arguments for the specified function
+        if not args:
+            args = self.args_template[action_name]["args"]
+        if len(args)==0:
+            return None
+        return {key: value['type'] for key, value in args.items()}
 
     
     def extract_actions_with_args(self, query_text: str, top_k: int = 3, threshold: float = 0.45) -> Dict[str, Any]:
@@ -288,27 +507,206 @@ class TextToAction:
                 - "message" (str): A message describing the status of the action extraction.
         """
 
-        actions_extracted = self.extract_actions(query_text=query_text, top_k=top_k, threshold=threshold)
-        extracted_functions_args = []
-        for function in actions_extracted["actions"]:
-            if function in self.args_template:
-                # Extract parameters
-                extracted_params = self.extract_parameters(
-                    query_text=query_text,
-                    action_name=function
-                )
-                
-                for param, param_type in self.args_template[function]["args"].items():
-                    if param not in extracted_params and not param_type["required"]:
-                        extracted_params[param] = None
-                    elif param not in extracted_params and param_type["required"]:
-                        verbose_print(f"Some or many of required parameters are not found for function {function}. Extracted parameters: {extracted_params}")
-                        break
+        extracted_params = {}
+        if self.filter_input and self.stream_filter and len(query_text.strip()) > 0:
+            actions_extracted, extracted_params = self._stream_actions(query_text=query_text, top_k=top_k, threshold=threshold)
+        else:
+            actions_extracted = self.extract_actions(query_text=query_text, top_k=top_k, threshold=threshold)
+        functions = [function for function in actions_extracted["actions"] if function in self.args_template]
+        # Parameters extracted while the filter response was streamed
+        actions = {function: self._action_with_args(function, extracted_params[function]) for function in functions if function in extracted_params}
+
+        pending = [function for function in functions if function not in actions]
+        arguments_dict = self._combined_arguments(pending)
+        combined_params = {}
+        if arguments_dict:
+            combined_params = self.parameter_extractor.extract_parameters_for_actions(query_text=query_text, arguments_dict=arguments_dict)
+        actions.update(self._combined_actions(pending, combined_params))
+
+        # Extract the remaining parameters one action at a time, concurrently if the extractor allows it
+        remaining = [function for function in functions if function not in actions]
+        workers = self._extraction_workers(remaining)
+        if workers > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                all_params = list(executor.map(lambda function: self.extract_parameters(query_text=query_text, action_name=function), remaining))
+        else:
+            all_params = [self.extract_parameters(query_text=query_text, action_name=function) for function in remaining]
+        for function, params in zip(remaining, all_params):
+            actions[function] = self._action_with_args(function, params)
+
+        # Keep the order of the detected actions
+        extracted_functions_args = [actions[function] for function in functions if actions[function] is not None]
+        return self._actions_with_args_result(extracted_functions_args, actions_extracted)
+
+    async def aextract_actions_with_args(self, query_text: str, top_k: int = 3, threshold: float = 0.45) -> Dict[str, Any]:
+        """
+        Async variant of extract_actions_with_args.
+        """
+        extracted_params = {}
+        if self.filter_input and self.stream_filter and len(query_text.strip()) > 0:
+            actions_extracted, extracted_params = await self._astream_actions(query_text=query_text, top_k=top_k, threshold=threshold)
+        else:
+            actions_extracted = await self.aextract_actions(query_text=query_text, top_k=top_k, threshold=threshold)
+        functions = [function for function in actions_extracted["actions"] if function in self.args_template]
+        actions = {function: self._action_with_args(function, extracted_params[function]) for function in functions if function in extracted_params}
+
+        pending = [function for function in functions if function not in actions]
+        arguments_dict = self._combined_arguments(pending)
+        combined_params = {}
+        if arguments_dict:
+            combined_params = await self.parameter_extractor.aextract_parameters_for_actions(query_text=query_text, arguments_dict=arguments_dict)
+        actions.update(self._combined_actions(pending, combined_params))
+
+        remaining = [function for function in functions if function not in actions]
+        semaphore = asyncio.Semaphore(self._extraction_workers(remaining))
+
+        async def extract(function):
+            async with semaphore:
+                return await self.aextract_parameters(query_text=query_text, action_name=function)
+
+        all_params = await asyncio.gather(*(extract(function) for function in remaining))
+        for function, params in zip(remaining, all_params):
+            actions[function] = self._action_with_args(function, params)
+
+        extracted_functions_args = [actions[function] for function in functions if actions[function] is not None]
+        return self._actions_with_args_result(extracted_functions_args, actions_extracted)
+
+    def _stream_actions(self, query_text, top_k=3, threshold=0.45, pooling="max"):
+        """
+        Same as extract_actions with filter_input, but the filter response is streamed: each refined action is retrieved,
+        and the parameter extraction of its matched actions is started, as soon as the filter has generated it.
+
+        Returns:
+            Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]: The result of extract_actions, and the extracted parameters of its actions.
+        """
+        confident_hits = self._confident_actions(query_text, top_k, pooling)
+        if confident_hits is not None:
+            return self._actions_result(self._retrieve_actions([query_text], confident_hits, top_k, threshold, pooling)), {}
+
+        queries = []
+        possible_actions = []
+        extractions = {}
+        workers = self.max_concurrent_extractions if self.parameter_extractor.thread_safe else 1
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            def dispatch(sub_query):
+                queries.append(sub_query)
+                hits = self._retrieve_actions([sub_query], None, top_k, threshold, pooling)
+                possible_actions.extend(hits)
+                for action_name, _ in hits:
+                    if action_name in self.args_template and action_name not in extractions:
+                        extractions[action_name] = executor.submit(self.extract_parameters, query_text=query_text, action_name=action_name)
+
+            response = None
+            for path, value in self.llm_client.stream_json_response(messages=self._filter_messages(query_text)):
+                if path == ():
+                    response = value
+                elif len(path) == 2 and path[0] == "actions" and isinstance(value, str):
+                    dispatch(value)
+            verbose_print("Filtered query:", response)
+
+            if response is not None and len(response["actions"])==0:
+                return response, {}
+            # Actions the parser couldn't report while streaming, e.g. when the JSON was only recovered from the full text
+            for sub_query in (response["actions"] if response is not None else [query_text]):
+                if sub_query not in queries:
+                    dispatch(sub_query)
+            extracted_params = {action_name: future.result() for action_name, future in extractions.items()}
+
+        return self._actions_result(possible_actions, response), extracted_params
+
+    async def _astream_actions(self, query_text, top_k=3, threshold=0.45, pooling="max"):
+        """
+        Async variant of _stream_actions.
+        """
+        confident_hits = await self._aconfident_actions(query_text, top_k, pooling)
+        if confident_hits is not None:
+            return self._actions_result(self._retrieve_actions([query_text], confident_hits, top_k, threshold, pooling)), {}
+
+        queries = []
+        possible_actions = []
+        extractions = {}
+        semaphore = asyncio.Semaphore(self.max_concurrent_extractions if self.parameter_extractor.thread_safe else 1)
+
+        async def extract(action_name):
+            async with semaphore:
+                return await self.aextract_parameters(query_text=query_text, action_name=action_name)
+
+        async def dispatch(sub_query):
+            queries.append(sub_query)
+            hits = await self._aretrieve_actions([sub_query], None, top_k, threshold, pooling)
+            possible_actions.extend(hits)
+            for action_name, _ in hits:
+                if action_name in self.args_template and action_name not in extractions:
+                    extractions[action_name] = asyncio.create_task(extract(action_name))
+
+        response = None
+        async for path, value in self.llm_client.astream_json_response(messages=self._filter_messages(query_text)):
+            if path == ():
+                response = value
+            elif len(path) == 2 and path[0] == "actions" and isinstance(value, str):
+                await dispatch(value)
+        verbose_print("Filtered query:", response)
+
+        if response is not None and len(response["actions"])==0:
+            return response, {}
+        for sub_query in (response["actions"] if response is not None else [query_text]):
+            if sub_query not in queries:
+                await dispatch(sub_query)
+        results = await asyncio.gather(*extractions.values())
+        return self._actions_result(possible_actions, response), dict(zip(extractions, results))
+
+    def _combined_arguments(self, functions)->Dict[str, Dict[str, str]]:
+        """
+        Returns the argument types of the actions whose parameters are extracted together, or None if combined extraction doesn't apply.
+        """
+        if not self.combined_extraction:
+            return None
+        arguments_dict = {function: self._formatted_args(function) for function in functions}
+        arguments_dict = {function: args for function, args in arguments_dict.items() if args is not None}
+        # A single action is extracted with its own prompt
+        return arguments_dict if len(arguments_dict) > 1 else None
+
+    def _combined_actions(self, functions, combined_params)->Dict[str, Dict[str, Any]]:
+        """
+        Returns the actions whose parameters are complete in the combined response, or that take no parameters.
+        The other actions are left out so they are extracted one by one.
+        """
+        actions = {}
+        for function in functions:
+            if self._formatted_args(function) is None:
+                actions[function] = self._action_with_args(function, {})
+            elif isinstance(combined_params.get(function), dict):
+                action = self._action_with_args(function, dict(combined_params[function]))
+                if action is not None:
+                    actions[function] = action
                 else:
-                    extracted_functions_args.append({
-                                "action": function,
-                                "args": extracted_params
-                            })
+                    verbose_print(f"Falling back to a separate parameter extraction for {function}")
+        return actions
+
+    def _extraction_workers(self, functions)->int:
+        """
+        Returns how many parameter extractions may run at the same time for the given actions.
+        """
+        if not self.parameter_extractor.thread_safe:
+            return 1
+        return max(1, min(self.max_concurrent_extractions, len(functions)))
+
+    def _action_with_args(self, function, extracted_params):
+        """
+        Fills in missing optional parameters. Returns the action with its args, or None if a required parameter is missing.
+        """
+        for param, param_type in self.args_template[function]["args"].items():
+            if param not in extracted_params and not param_type["required"]:
+                extracted_params[param] = None
+            elif param not in extracted_params and param_type["required"]:
+                verbose_print(f"Some or many of required parameters are not found for function {function}. Extracted parameters: {extracted_params}")
+                return None
+        return {
+                    "action": function,
+                    "args": extracted_params
+                }
+
+    def _actions_with_args_result(self, extracted_functions_args, actions_extracted):
         if self.filter_input:
             message = actions_extracted["message"]
         else:
@@ -372,5 +770,24 @@ class TextToAction:
 
         return {"message": actions_to_execute["message"], "results": results}
 
+    async def arun(self, query_text: str, top_k: int = 1, **kwargs) -> Dict[str, Any]:
+        """
+        Async variant of run. Actions are executed in order; coroutine actions are awaited.
+        """
+        if self.actions_module is None:
+            raise Exception("Actions module is not loaded. Please make sure to provide a value for action_implementation_filepath.")
+
+        actions_to_execute = await self.aextract_actions_with_args(query_text, top_k, **kwargs)
+        results = []
+        for action in actions_to_execute["actions"]:
+            result = await self.aexecute_action(action_name=action["action"], extracted_parameters=action["args"])
+            results.append({
+                "action": action["action"],
+                "args": action["args"],
+                "output": result
+            })
+
+        return {"message": actions_to_execute["message"], "results": results}
+
 
         
\ No newline at end of file
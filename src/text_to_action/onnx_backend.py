@@ -0,0 +1,174 @@
+import os
+import inspect
+from typing import Dict, List, Union
+import numpy as np
+
+# Default location for exported models when no output directory is given
+ONNX_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "text_to_action", "onnx")
+
+MODEL_FILENAME = "model.onnx"
+QUANTIZED_MODEL_FILENAME = "model_quantized.onnx"
+
+# Texts the exported model is checked on against the PyTorch model
+VERIFICATION_TEXTS = ["export sample", "resize the image to 300x300 pixels", "What is 20 plus 35?",
+                      "Schedule a meeting with the design team tomorrow at 10am"]
+
+
+def resolve_hub_identifier(model_identifier:str)->str:
+    """
+    SBERT accepts short names like "all-MiniLM-L6-v2"; the HuggingFace hub needs the organization as well.
+    """
+    if os.path.isdir(model_identifier) or "/" in model_identifier:
+        return model_identifier
+    return f"sentence-transformers/{model_identifier}"
+
+
+def export_onnx_model(model_identifier:str, output_dir:str=None, quantize:bool=True, opset:int=14,
+                      verify:bool=True, tolerance:float=0.01)->str:
+    """
+    Exports a HuggingFace/SBERT transformer to ONNX and optionally quantizes its weights to int8.
+
+    Args:
+        model_identifier: The model to export (e.g. "all-MiniLM-L6-v2").
+        output_dir: Where to save the ONNX model(s) and the tokenizer. Defaults to a folder in ONNX_CACHE_DIR.
+        quantize: If True, also writes a dynamically int8-quantized model next to the float32 one.
+        opset: The ONNX opset version.
+        verify: If True, the float32 export is compared with the PyTorch model (see compare_with_reference) and
+            removed again if it is not within tolerance.
+        tolerance: The largest acceptable cosine distance between the ONNX and PyTorch embeddings of a text.
+
+    Returns:
+        str: The output directory.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    hub_identifier = resolve_hub_identifier(model_identifier)
+    if output_dir is None:
+        output_dir = os.path.join(ONNX_CACHE_DIR, hub_identifier.replace("/", "--"))
+    os.makedirs(output_dir, exist_ok=True)
+
+    tokenizer = AutoTokenizer.from_pretrained(hub_identifier)
+    model = AutoModel.from_pretrained(hub_identifier).eval()
+    tokenizer.save_pretrained(output_dir)
+
+    inputs = tokenizer(VERIFICATION_TEXTS[:1], return_tensors="pt")
+    # The graph inputs follow the order of forward's parameters (e.g. BERT takes attention_mask before
+    # token_type_ids), not the tokenizer's order, so the inputs are passed by name and named in that order
+    forward_parameters = list(inspect.signature(model.forward).parameters)
+    input_names = sorted((name for name in inputs if name in forward_parameters), key=forward_parameters.index)
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    model_path = os.path.join(output_dir, MODEL_FILENAME)
+    with torch.inference_mode():
+        torch.onnx.export(model, ({name: inputs[name] for name in input_names},), model_path,
+                          input_names=input_names, output_names=["last_hidden_state"],
+                          dynamic_axes=dynamic_axes, opset_version=opset)
+
+    if verify:
+        comparison = compare_with_reference(ONNXSentenceEncoder(output_dir, quantize=False), VERIFICATION_TEXTS,
+                                            reference_model=model_identifier, tolerance=tolerance)
+        if not comparison["within_tolerance"]:
+            os.remove(model_path)
+            raise RuntimeError(f"The ONNX export of {model_identifier} doesn't match the PyTorch model: {comparison}")
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(model_path, os.path.join(output_dir, QUANTIZED_MODEL_FILENAME), weight_type=QuantType.QInt8)
+
+    return output_dir
+
+
+class ONNXSentenceEncoder:
+    """
+    Sentence encoder running an exported transformer with ONNX Runtime: attention-mask-aware mean pooling
+    followed by L2 normalization, the same as the SBERT all-MiniLM/mpnet models.
+    """
+    def __init__(self, model_identifier:str, quantize:bool=True, max_length:int=256, normalize:bool=True,
+                 providers:List[str]=None, intra_op_threads:int=None):
+        """
+        Args:
+            model_identifier: A directory containing model.onnx (and model_quantized.onnx) plus the tokenizer,
+                or a model name, which is exported to ONNX_CACHE_DIR on first use.
+            quantize: If True, the int8-quantized model is used when available.
+            max_length: Texts are truncated to this many tokens.
+            normalize: If True, the embeddings are L2 normalized.
+            providers: ONNX Runtime execution providers. Defaults to CPU.
+            intra_op_threads: Number of threads ONNX Runtime uses per inference. Defaults to ONNX Runtime's choice.
+        """
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        model_dir = model_identifier
+        if not os.path.isfile(os.path.join(model_dir, MODEL_FILENAME)):
+            model_dir = os.path.join(ONNX_CACHE_DIR, resolve_hub_identifier(model_identifier).replace("/", "--"))
+            if not os.path.isfile(os.path.join(model_dir, MODEL_FILENAME)):
+                export_onnx_model(model_identifier, output_dir=model_dir, quantize=quantize)
+
+        model_path = os.path.join(model_dir, QUANTIZED_MODEL_FILENAME)
+        if not quantize or not os.path.isfile(model_path):
+            model_path = os.path.join(model_dir, MODEL_FILENAME)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=providers or ["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model_path = model_path
+        self.max_length = max_length
+        self.normalize = normalize
+
+    def encode(self, texts:Union[str, List[str]], batch_size:int=32)->np.ndarray:
+        """
+        Encodes a text into a (D,) array or a list of texts into a (N x D) array.
+        """
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            inputs = self.tokenizer(texts[start:start + batch_size], padding=True, truncation=True,
+                                    max_length=self.max_length, return_tensors="np")
+            feed = {name: value.astype(np.int64) for name, value in inputs.items() if name in self.input_names}
+            hidden_states = self.session.run(["last_hidden_state"], feed)[0]
+
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            embeddings = (hidden_states * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if self.normalize:
+                embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+            batches.append(embeddings.astype(np.float32))
+
+        embeddings = np.concatenate(batches) if batches else np.zeros((0, 0), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+
+def compare_with_reference(onnx_model, texts:List[str], reference_model="all-MiniLM-L6-v2", tolerance:float=0.01)->Dict[str, float]:
+    """
+    Compares ONNX embeddings with the embeddings of the reference model that existing embeddings files were created with.
+
+    Args:
+        onnx_model: A VectorEmbeddingModel with ModelSource.ONNX (or an ONNXSentenceEncoder).
+        texts: Texts to compare on, e.g. the descriptions and examples from descriptions.json.
+        reference_model: The SBERT model identifier (or a VectorEmbeddingModel) to compare against.
+        tolerance: The largest acceptable cosine distance between the two embeddings of a text.
+
+    Returns:
+        Dict[str, float]: The min/mean cosine similarity, the max absolute difference and whether all texts are within tolerance.
+    """
+    from .vector_emb import VectorEmbeddingModel
+
+    if isinstance(reference_model, str):
+        reference_model = VectorEmbeddingModel(model_identifier=reference_model)
+    reference = reference_model.compute_sentence_embeddings(list(texts)).detach().cpu().numpy()
+    if isinstance(onnx_model, ONNXSentenceEncoder):
+        candidate = onnx_model.encode(list(texts))
+    else:
+        candidate = onnx_model.compute_sentence_embeddings(list(texts)).detach().cpu().numpy()
+
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosine = (reference * candidate).sum(axis=1)
+    return {"min_cosine": float(cosine.min()), "mean_cosine": float(cosine.mean()),
+            "max_abs_diff": float(np.abs(reference - candidate).max()),
+            "within_tolerance": bool((1 - cosine.min()) <= tolerance)}
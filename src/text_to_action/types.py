@@ -6,6 +6,16 @@ from dataclasses import dataclass
 class ModelSource(Enum):
     HUGGINGFACE = auto()
     SBERT = auto()
+    ONNX = auto()
+
+class IndexType(Enum):
+    EXACT = auto()
+    IVF = auto()
+
+class EmbeddingDType(Enum):
+    FLOAT32 = "float32"
+    FLOAT16 = "float16"
+    INT8 = "int8"
 
 class LLM_API(Enum):
     OPEN_AI = "open_ai"
@@ -3,6 +3,12 @@ import re
 import os
 import fnmatch
 import concurrent.futures
+import threading
+import time
+import stat
+import tempfile
+from contextlib import contextmanager
+from collections import OrderedDict
 from pathlib import Path
 import platform
 
@@ -28,6 +34,92 @@ def verbose_print(*args, **kwargs):
         print(*args, **kwargs)
 
 
+class LRUCache:
+    """
+    A thread-safe, bounded mapping that evicts the least recently used entry and counts hits and misses.
+    With a ttl (in seconds), entries older than the ttl are treated as missing.
+    """
+    def __init__(self, maxsize=1024, ttl:float=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> (value, expiry time or None)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                value, expires_at = self._data[key]
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value, ttl:float=None):
+        """
+        Stores a value. ttl overrides the cache's ttl for this entry, e.g. to keep the remaining lifetime of a value copied from elsewhere.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data), "maxsize": self.maxsize,
+                "hit_rate": self.hits / total if total else 0.0}
+
+
+def _file_mode(file_path)->int:
+    """
+    Returns the permission bits of an existing file, or those open() would give a new file under the current umask.
+    """
+    try:
+        return stat.S_IMODE(os.stat(file_path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+@contextmanager
+def atomic_write_path(file_path):
+    """
+    Yields a temporary path next to file_path, and moves it over file_path once the block has finished without errors.
+    Readers of the old file (e.g. a memory mapping of it) keep seeing the old contents instead of a truncated file.
+    The new file gets the permissions of the file it replaces, or the umask's default for a new file.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix="." + os.path.basename(file_path) + ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        yield tmp_path
+        # mkstemp creates the file readable by its owner only
+        os.chmod(tmp_path, _file_mode(file_path))
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
 # @helper
 def extract_numeric(value):
     if type(value) in [int, float]:
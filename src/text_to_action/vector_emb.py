@@ -1,31 +1,156 @@
 import os
+import asyncio
+import threading
+import sys
+import time
+import json
+import uuid
+import hashlib
 from typing import List,Dict
+from collections.abc import MutableMapping
 import base64
 import pickle
 import h5py
-from transformers import AutoModel, AutoTokenizer
+import numpy as np
 import torch
-from sentence_transformers import SentenceTransformer, util
-from .types import ModelSource
+from .types import ModelSource, IndexType, EmbeddingDType
+from .ann_index import IVFIndex
+from .lexical_index import LexicalIndex
+from .utils import LRUCache, atomic_write_path
+from .batching import EmbeddingMicroBatcher
 import torch.nn.functional as F
 from . import EMBEDDINGS_DIR
 
 
+class _NodeKwargs(MutableMapping):
+    """
+    Write-through view of a node's extra attributes: setting or deleting a key updates the node (and, for a view node,
+    the store columns that hold id_name, content_hash, namespace and text).
+    """
+    __slots__ = ("_node",)
+
+    def __init__(self, node):
+        self._node = node
+
+    def __getitem__(self, item):
+        return self._node._kwargs_dict()[item]
+
+    def __setitem__(self, item, value):
+        self._node._set_kwarg(item, value)
+
+    def __delitem__(self, item):
+        self._node._del_kwarg(item)
+
+    def __iter__(self):
+        return iter(self._node._kwargs_dict())
+
+    def __len__(self):
+        return len(self._node._kwargs_dict())
+
+    def __repr__(self):
+        return repr(self._node._kwargs_dict())
+
+
 class VectorNode:
     """
     Base representation of a vector node.
+
+    A node either holds its own embedding, or is a lightweight view of a row of a VectorStore's matrix
+    (see VectorNode.view), in which case the embedding is read from the store on access.
+    Extra attributes passed as kwargs can be accessed directly as attributes; id_name is stored in its own (interned) slot.
     """
+    __slots__ = ("key", "id_name", "_embedding", "_store", "_row", "_extra")
+
     def __init__(self, key: str | int, embedding: torch.Tensor,**kwargs)->None:
         self.key = key
-        self.embedding = embedding
+        self._embedding = embedding
+        self._store = None
+        self._row = None
+        self._extra = None
         self.kwargs = kwargs
 
+    @classmethod
+    def view(cls, store, row:int, key: str | int, id_name:str=None, extra:dict=None):
+        """
+        Creates a node that refers to a row of the store's matrix instead of holding its own embedding.
+        """
+        node = cls.__new__(cls)
+        node.key = key
+        node._embedding = None
+        node._store = store
+        node._row = row
+        node._extra = extra or None
+        if id_name is not None:
+            node.id_name = sys.intern(id_name) if isinstance(id_name, str) else id_name
+        return node
+
+    @property
+    def embedding(self)->torch.Tensor:
+        if self._store is not None:
+            return self._store._row_embedding(self._row)
+        return self._embedding
+
+    @embedding.setter
+    def embedding(self, embedding:torch.Tensor):
+        self._embedding = embedding
+        self._store = None
+        self._row = None
+
+    @property
+    def kwargs(self)->MutableMapping:
+        """
+        The extra attributes of the node, including id_name. Changes made through it are stored on the node.
+        """
+        return _NodeKwargs(self)
+
+    def _kwargs_dict(self)->dict:
+        kwargs = {}
+        if hasattr(self, "id_name"):
+            kwargs["id_name"] = self.id_name
+        if self._store is not None:
+            kwargs.update(self._store._row_attributes(self._row))
+        if self._extra:
+            kwargs.update(self._extra)
+        return kwargs
+
+    @kwargs.setter
+    def kwargs(self, kwargs:dict):
+        kwargs = dict(kwargs)
+        node_kwargs = self.kwargs
+        node_kwargs.clear()
+        node_kwargs.update(kwargs)
+
+    def _set_kwarg(self, item, value):
+        if item == "id_name":
+            value = sys.intern(value) if isinstance(value, str) else value
+            self.id_name = value
+        if self._store is not None and item in self._store._ROW_COLUMNS:
+            self._store._set_row_attribute(self._row, item, value)
+        elif item != "id_name":
+            if self._extra is None:
+                self._extra = {}
+            self._extra[item] = value
+
+    def _del_kwarg(self, item):
+        if item not in self._kwargs_dict():
+            raise KeyError(item)
+        if item == "id_name":
+            del self.id_name
+        if self._store is not None and item in self._store._ROW_COLUMNS:
+            self._store._set_row_attribute(self._row, item, None)
+        elif item != "id_name":
+            del self._extra[item]
+            self._extra = self._extra or None
+
     def __getattr__(self, item):
         """
         Allows accessing kwargs directly as attributes.
         """
+        # Unset slots also end up here; never look them up in kwargs (that would recurse)
+        if item in VectorNode.__slots__:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{item}'")
         try:
-            return self.kwargs[item]
+            return self._kwargs_dict()[item]
         except KeyError:
             raise AttributeError(f"'{type(self).__name__}' object has no attribute '{item}'")
         
@@ -37,7 +162,7 @@ class VectorNode:
             'key': self.key,
             'embedding': self.embedding.tolist(),
             # Include any extra attributes
-            **self.kwargs
+            **self._kwargs_dict()
         }
         return data
     
@@ -51,21 +176,67 @@ class VectorNode:
         return cls(key, embedding, **data)
     
     
+class _StoreNodes(MutableMapping):
+    """
+    The nodes of a VectorStore by key. Setting or deleting a node updates the store's rows, so the search matrix
+    never goes out of sync with its nodes.
+    """
+    __slots__ = ("_store",)
+
+    def __init__(self, store):
+        self._store = store
+
+    def __getitem__(self, key):
+        return self._store._materialized_nodes()[key]
+
+    def __setitem__(self, key, node):
+        self._store._set_node(key, node)
+
+    def __delitem__(self, key):
+        self._store._remove_keys([key])
+
+    def __iter__(self):
+        return iter(self._store._materialized_nodes())
+
+    def __len__(self):
+        return len(self._store)
+
+    def clear(self):
+        self._store._remove_keys(list(self._store._keys))
+
+    def __repr__(self):
+        return repr(self._store._materialized_nodes())
+
+
 class VectorEmbeddingModel:
-    def __init__(self, model_identifier="all-MiniLM-L6-v2", model_source=ModelSource.SBERT):
+    def __init__(self, model_identifier="all-MiniLM-L6-v2", model_source=ModelSource.SBERT, onnx_options:dict=None):
+        """
+        Args:
+            model_identifier (str): The identifier of the embedding model. For ModelSource.ONNX, either a directory with an exported
+                model.onnx or a model name that is exported on first use.
+            model_source (ModelSource, optional): The source of the embedding model. Defaults to ModelSource.SBERT.
+            onnx_options (dict, optional): Keyword arguments for ONNXSentenceEncoder (e.g. quantize, max_length, intra_op_threads). Defaults to None.
+        """
         self.model_identifier = model_identifier
         self.model_source = model_source
+        self.onnx_options = onnx_options or {}
         self.model = self.load_model()
 
     def load_model(self):
 
         if self.model_source == ModelSource.HUGGINGFACE:
+            from transformers import AutoModel, AutoTokenizer
             tokenizer = AutoTokenizer.from_pretrained(self.model_identifier)
-            model = AutoModel.from_pretrained(self.model_identifier)
+            model = AutoModel.from_pretrained(self.model_identifier).eval()
             return (model, tokenizer)
         
         elif self.model_source == ModelSource.SBERT:
+                from sentence_transformers import SentenceTransformer
                 return SentenceTransformer(self.model_identifier)
+
+        elif self.model_source == ModelSource.ONNX:
+            from .onnx_backend import ONNXSentenceEncoder
+            return ONNXSentenceEncoder(self.model_identifier, **self.onnx_options)
         else:
             # Load non-Hugging Face models here
             raise NotImplementedError("Loading models of this type is not yet implemented yet. You can implement it here.")
@@ -75,21 +246,53 @@ class VectorEmbeddingModel:
         Compute embeddings for a given text.
         """
         if self.model_source == ModelSource.HUGGINGFACE:
-            model, tokenizer = self.model
-            inputs = tokenizer(text, return_tensors="pt", padding=True, truncation=True, **kwargs)
-            with torch.no_grad():
-                outputs = model(**inputs)
-            # Extract embeddings (e.g., last hidden state)
-            embeddings = outputs.last_hidden_state.mean(dim=1)[0]
-            return embeddings
+            return self._encode_huggingface(text, **kwargs)
         
         elif self.model_source == ModelSource.SBERT:
             return self.model.encode(text,convert_to_tensor=True, **kwargs)
+
+        elif self.model_source == ModelSource.ONNX:
+            return torch.from_numpy(self.model.encode(text, **kwargs))
         
         else:
             # Compute embeddings for non-Hugging Face models
             raise NotImplementedError("Computing embeddings for this model is not yet implemented yet. You can implement it here.")
 
+    def _encode_huggingface(self, text, batch_size=32, max_length=None, normalize=False, **kwargs):
+        """
+        Encodes a text into a (D,) tensor or a list of texts into a (N x D) tensor with a HuggingFace model,
+        mean pooling the last hidden state over the non-padding tokens of each text.
+
+        Args:
+            text (str | List[str]): The text(s) to encode.
+            batch_size (int, optional): The number of texts per forward pass. Defaults to 32.
+            max_length (int, optional): Texts are truncated to this many tokens. Defaults to the tokenizer's maximum.
+            normalize (bool, optional): If True, the embeddings are L2 normalized. Defaults to False.
+            **kwargs: Passed to the tokenizer.
+        """
+        model, tokenizer = self.model
+        single = isinstance(text, str)
+        texts = [text] if single else list(text)
+        # Encode texts of similar length together to reduce padding, then restore the input order
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+
+        batches = []
+        with torch.inference_mode():
+            for start in range(0, len(texts), batch_size):
+                inputs = tokenizer([texts[i] for i in order[start:start + batch_size]], return_tensors="pt",
+                                   padding=True, truncation=True, max_length=max_length, **kwargs).to(model.device)
+                hidden_states = model(**inputs).last_hidden_state
+                mask = inputs["attention_mask"].unsqueeze(-1).to(hidden_states.dtype)
+                batches.append((hidden_states * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9))
+
+        if not batches:
+            return torch.zeros((0, model.config.hidden_size))
+        embeddings = torch.empty((len(texts), batches[0].shape[1]), dtype=batches[0].dtype, device=batches[0].device)
+        embeddings[torch.tensor(order, device=embeddings.device)] = torch.cat(batches)
+        if normalize:
+            embeddings = F.normalize(embeddings, dim=1)
+        return embeddings[0] if single else embeddings
+
 
     def semantic_search(self,query_embedding, vector_nodes:List[VectorNode], top_k=5,**kwargs):
         """
@@ -105,15 +308,20 @@ class VectorEmbeddingModel:
         """
         
         if self.model_source == ModelSource.SBERT:
+            from sentence_transformers import util
             search_results = util.semantic_search(query_embedding, torch.stack([node.embedding for node in vector_nodes]), top_k=top_k, **kwargs)
                 # Map the search results to VectorNode objects and their scores
             node_scores = [(vector_nodes[result['corpus_id']], result['score']) for result in search_results[0]]
             
             return node_scores
         else: # self.model_source == ModelSource.HUGGINGFACE:
-            similarities = [(node, self.cosine_similarity(query_embedding, node.embedding)) for node in vector_nodes]
-            similarities.sort(key=lambda x: x[1], reverse=True)
-            return similarities[:top_k]
+            if len(vector_nodes) == 0:
+                return []
+            # Score every node with one matrix-vector product over normalized embeddings, then take the top k
+            corpus_embeddings = F.normalize(torch.stack([node.embedding for node in vector_nodes]).float(), dim=1)
+            query_embedding = F.normalize(query_embedding.float().reshape(-1), dim=0).to(corpus_embeddings.device)
+            top = torch.topk(corpus_embeddings @ query_embedding, k=min(top_k, len(vector_nodes)))
+            return [(vector_nodes[i], score) for score, i in zip(top.values.tolist(), top.indices.tolist())]
         # else:
         #     # Perform semantic search for non-Hugging Face models
         #     raise NotImplementedError("Performing semantic search for this model is not yet implemented yet. You can implement it here.")
@@ -133,12 +341,29 @@ class VectorStore:
     An implementation of Vector Database. A base class for a vector store that manages a collection of vector nodes.
     """
     
-    def __init__(self, embedding_model="all-MiniLM-L6-v2",model_source = ModelSource.SBERT,node_type=VectorNode):
+    def __init__(self, embedding_model="all-MiniLM-L6-v2",model_source = ModelSource.SBERT,node_type=VectorNode,
+                 index_type=IndexType.EXACT, index_params:dict=None, query_cache_size=0,
+                 storage_dtype:EmbeddingDType=None, micro_batch_wait_ms:float=None, micro_batch_size:int=32,
+                 lexical_weight:float=0.0, lexical_params:dict=None):
         """
         Args:
             embedding_model (str): The identifier of the embedding model to use. Defaults to "all-MiniLM-L6-v2".
             model_source (ModelSource, optional): The source of the embedding model. Defaults to ModelSource.SBERT.
             node_type (VectorNode, optional): The type of the node to store. Defaults to VectorNode.
+            index_type (IndexType, optional): EXACT scans every node per query, IVF uses an approximate nearest-neighbor index
+                that is saved next to the embeddings file. Defaults to IndexType.EXACT.
+            index_params (dict, optional): Keyword arguments for the index (e.g. n_lists, n_probe for IVFIndex). Defaults to None.
+            query_cache_size (int, optional): The number of query embeddings to keep in an LRU cache. 0 disables the cache. Defaults to 0.
+            storage_dtype (EmbeddingDType, optional): The precision of the stored matrix, in memory and on disk. FLOAT16 halves the memory,
+                INT8 (symmetric, with a float32 scale per row) quarters it. Defaults to None, which keeps the precision of a loaded file
+                and uses FLOAT32 otherwise.
+            micro_batch_wait_ms (float, optional): If set, query texts from concurrent callers are queued for up to this many
+                milliseconds and encoded together (see EmbeddingMicroBatcher). Defaults to None, which encodes each call directly.
+            micro_batch_size (int, optional): The maximum number of query texts encoded together. Defaults to 32.
+            lexical_weight (float, optional): Weight of the character n-gram score (see LexicalIndex) in the score of a row,
+                (1 - lexical_weight) * semantic + lexical_weight * lexical, for query_actions(_batch). Only rows with a stored text
+                are fused. Defaults to 0.0, which only uses the semantic score.
+            lexical_params (dict, optional): Keyword arguments for LexicalIndex (e.g. ngram_range). Defaults to None.
         """
         if isinstance(embedding_model, str):
             self.embedding_model = VectorEmbeddingModel(model_identifier=embedding_model, model_source=model_source)
@@ -146,58 +371,374 @@ class VectorStore:
             self.embedding_model = embedding_model
 
         self.node_type = node_type
-        self.vector_nodes:Dict[str, node_type] = {}
+        self._nodes:Dict[str, node_type] = {}
+
+        # Contiguous, L2-normalized (N x D) copy of the node embeddings used for search, stored in self.storage_dtype.
+        # Row i belongs to the node with key self._keys[i]; new rows are buffered (in float32) in
+        # self._pending_rows and appended to the matrix on the next search.
+        self._matrix:torch.Tensor = None
+        # Per-row dequantization scales, only used for EmbeddingDType.INT8
+        self._scales:torch.Tensor = None
+        self._storage_dtype_fixed = storage_dtype is not None
+        self.storage_dtype = storage_dtype or EmbeddingDType.FLOAT32
+        self._pending_rows:List[torch.Tensor] = []
+        self._keys:List[str] = []
+        self._id_names:List[str] = []
+        self._content_hashes:List[str] = []
+        # The text each row was encoded from, if known; used by the lexical index
+        self._texts:List[str] = []
+        # The catalog each row belongs to (None for rows added without a namespace), see add_catalog
+        self._namespaces:List[str] = []
+        self._row_of:Dict[str, int] = {}
+        # (row -> action index tensor, action names), rebuilt when the id_names or namespaces change
+        self._action_groups = None
+        # (row -> namespace index tensor, namespace names), rebuilt when the namespaces change
+        self._namespace_groups = None
+        self.lexical_weight = lexical_weight
+        self.lexical_params = lexical_params or {}
+        # LexicalIndex over self._texts, rebuilt on the first lexical query after the rows change
+        self._lexical_index:LexicalIndex = None
+        # Incremented whenever rows are added, removed or replaced, see _rows_changed
+        self._generation = 0
+        # Guards the row columns, the matrix and its pending rows: queries may run in several threads while rows change
+        self._lock = threading.RLock()
+        # True when rows were loaded from a columnar file and their nodes are only created on access.
+        self._lazy_rows = False
+
+        if index_type == IndexType.IVF:
+            self.index = IVFIndex(**(index_params or {}))
+        else:
+            self.index = None
+
+        self.query_cache = LRUCache(maxsize=query_cache_size) if query_cache_size > 0 else None
+
+        if micro_batch_wait_ms is not None:
+            self.batcher = EmbeddingMicroBatcher(self.vectorize_texts, max_batch_size=micro_batch_size, max_wait_ms=micro_batch_wait_ms)
+        else:
+            self.batcher = None
+
+    @property
+    def vector_nodes(self)->MutableMapping:
+        """
+        The stored nodes by key. Setting or deleting a node through it updates the search matrix; nodes loaded
+        from a columnar file are created on first access.
+        """
+        return _StoreNodes(self)
+
+    @vector_nodes.setter
+    def vector_nodes(self, nodes:Dict[str, VectorNode]):
+        with self._lock:
+            self._nodes = dict(nodes)
+            self._lazy_rows = False
+            self._rebuild_matrix()
+
+    def _materialized_nodes(self)->Dict[str, VectorNode]:
+        with self._lock:
+            if self._lazy_rows:
+                for row in range(len(self._keys)):
+                    self._node_at(row)
+                self._lazy_rows = False
+            return self._nodes
+
+    def _set_node(self, key, node:VectorNode):
+        """
+        Stores a node under its key, adding or replacing its row of the search matrix.
+        """
+        if node.key != key:
+            raise ValueError(f"Node key {node.key!r} doesn't match the key it is stored under ({key!r})")
+        if getattr(node, "_store", None) not in (None, self):
+            # A view of another store's row; keep a copy that doesn't depend on that store
+            node = self.node_type(key, node.embedding, **node.kwargs)
+        with self._lock:
+            self._nodes[key] = node
+            self._index_node(node)
+
+    def _remove_keys(self, keys):
+        """
+        Removes the nodes with the given keys and compacts the search matrix. Raises KeyError for unknown keys.
+        """
+        with self._lock:
+            rows = {self._row_of[key] for key in keys}
+            self._get_matrix()
+            self._keep_rows([row for row in range(len(self._keys)) if row not in rows])
 
     def __str__(self):
-        return f"{self.__class__.__name__} with {len(self.vector_nodes)} nodes"
+        return f"{self.__class__.__name__} with {len(self)} nodes"
     
     def __add__(self, other):
         self.integrate_databases(other)
         return self
     
     def __len__(self):
-        return len(self.vector_nodes)
+        return len(self._keys)
 
     @classmethod
     def set_node_type(cls, node_type):
         cls.node_type = node_type
 
-    def save(self, filename):
+    @staticmethod
+    def _resolve_path(filename):
+        if os.path.isabs(filename):
+            return filename
+        return os.path.join(EMBEDDINGS_DIR, filename)
+
+    @staticmethod
+    def _index_path(file_path):
+        return os.path.splitext(file_path)[0] + ".ivf.h5"
+
+    def save(self, filename, format_version=2):
         """
         Saves the vectors to a file.
 
         Args:
             filename (str): The filepath or name of the file to save the vectors to.
+            format_version (int, optional): 2 writes the columnar format (one float32 (N x D) dataset plus key/id_name arrays),
+                1 writes the legacy format (one pickled dataset per node). Defaults to 2.
         """
-        if os.path.isabs(filename):
-            file_path = filename
-        else:
-            file_path = os.path.join(EMBEDDINGS_DIR, filename)
+        file_path = self._resolve_path(filename)
 
         print("Saving the file to: " + file_path)
-        with h5py.File(file_path, 'w') as f:
-            for key, vector_node in self.vector_nodes.items():
-                # Serialize the value to a byte string and encode it to base64 (to avoid NULL errors) )
-                serialized_value = base64.b64encode(pickle.dumps(vector_node.to_dict()))
-                f.create_dataset(key, data=serialized_value)
+        build_id = uuid.uuid4().hex
+        # Written to a temporary file first: this store (or another process) may have the old file memory mapped
+        with atomic_write_path(file_path) as tmp_path, h5py.File(tmp_path, 'w') as f:
+            if format_version == 1:
+                for key, vector_node in self.vector_nodes.items():
+                    # Serialize the value to a byte string and encode it to base64 (to avoid NULL errors) )
+                    serialized_value = base64.b64encode(pickle.dumps(vector_node.to_dict()))
+                    f.create_dataset(key, data=serialized_value)
+            elif format_version == 2:
+                self._save_columnar(f, build_id)
+            else:
+                raise ValueError(f"Unsupported embeddings format version: {format_version}")
+
+        if self.index is not None and len(self) > 0:
+            self._build_index_if_needed()
+            self.index.save(self._index_path(file_path), build_id=build_id)
+
+    def _save_columnar(self, f:h5py.File, build_id:str=None):
+        """
+        Writes the search matrix and its key/id_name arrays to an open HDF5 file.
+        The embeddings dataset is stored contiguous and uncompressed so that it can be memory mapped on load.
+        """
+        matrix = self._get_matrix()
+        embeddings = matrix.numpy() if matrix is not None else np.zeros((0, 0), dtype=np.float32)
+        string_dtype = h5py.string_dtype(encoding="utf-8")
+
+        f.create_dataset("embeddings", data=embeddings)
+        if self._scales is not None:
+            f.create_dataset("scales", data=self._scales.numpy())
+        f.create_dataset("keys", data=self._keys, dtype=string_dtype)
+        f.create_dataset("id_names", data=["" if name is None else name for name in self._id_names], dtype=string_dtype)
+        if any(content_hash is not None for content_hash in self._content_hashes):
+            f.create_dataset("content_hashes", data=[content_hash or "" for content_hash in self._content_hashes], dtype=string_dtype)
+        if any(text is not None for text in self._texts):
+            f.create_dataset("texts", data=[text or "" for text in self._texts], dtype=string_dtype)
+        if any(namespace is not None for namespace in self._namespaces):
+            f.create_dataset("namespaces", data=[namespace or "" for namespace in self._namespaces], dtype=string_dtype)
+        f.attrs["metadata"] = json.dumps({
+            "format_version": 2,
+            "model_identifier": self.embedding_model.model_identifier,
+            "model_source": self.embedding_model.model_source.name,
+            "dimension": int(embeddings.shape[1]),
+            "normalized": True,
+            "dtype": self.storage_dtype.value,
+            "build_id": build_id,
+        })
 
     def load(self, filename):
         """
-        Loads the vectors from a file.
+        Loads the vectors from a file. Both the columnar format and the legacy per-node format are supported.
 
         Args:
             filename (str): The name of the file to load the vectors from or the full path to the file.
         """
-        if os.path.isabs(filename):
-            file_path = filename
+        file_path = self._resolve_path(filename)
+
+        with self._lock:
+            build_id = None
+            with h5py.File(file_path, 'r') as f:
+                if "metadata" in f.attrs:
+                    build_id = self._load_columnar(f, file_path)
+                else:
+                    for key in f.keys():
+                        # Decode the value from base64 and deserialize it from a byte string
+                        data = pickle.loads(base64.b64decode(f[key][()]))
+                        self._nodes[key] = self.node_type.from_dict(data)
+                    self._rebuild_matrix()
+
+            self._load_index(file_path, build_id)
+
+    def _load_index(self, file_path:str, build_id:str=None):
+        """
+        Loads the ANN index saved next to the embeddings file. A missing or stale index is rebuilt on the first query.
+        """
+        if self.index is None:
+            return
+        index_path = self._index_path(file_path)
+        if build_id and os.path.isfile(index_path) and self.index.load(index_path) == build_id:
+            return
+        self.index.reset()
+
+    def _load_columnar(self, f:h5py.File, file_path:str)->str:
+        """
+        Loads a columnar embeddings file. The embeddings are memory mapped (copy-on-write) instead of read into memory.
+
+        Returns:
+            str: The build id of the file if its rows were loaded as-is, otherwise None.
+        """
+        metadata = json.loads(f.attrs["metadata"])
+        if metadata.get("model_identifier") != self.embedding_model.model_identifier:
+            print(f"Warning: {file_path} was created with '{metadata.get('model_identifier')}', "
+                  f"but the store uses '{self.embedding_model.model_identifier}'")
+
+        keys = list(f["keys"].asstr()[()])
+        id_names = [name or None for name in f["id_names"].asstr()[()]]
+        if "content_hashes" in f:
+            content_hashes = [content_hash or None for content_hash in f["content_hashes"].asstr()[()]]
+        else:
+            content_hashes = [None] * len(keys)
+        if "texts" in f:
+            texts = [text or None for text in f["texts"].asstr()[()]]
+        else:
+            texts = [None] * len(keys)
+        if "namespaces" in f:
+            namespaces = [namespace or None for namespace in f["namespaces"].asstr()[()]]
         else:
-            file_path = os.path.join(EMBEDDINGS_DIR, filename)
+            namespaces = [None] * len(keys)
+        dataset = f["embeddings"]
+        offset = dataset.id.get_offset()
+        if len(keys) == 0:
+            return None
+        if offset is None or dataset.chunks is not None or dataset.compression is not None:
+            embeddings = dataset[()]
+        else:
+            embeddings = np.memmap(file_path, dtype=dataset.dtype, mode="c", offset=offset, shape=dataset.shape)
+
+        matrix = torch.from_numpy(embeddings)
+        scales = torch.from_numpy(f["scales"][()]) if "scales" in f else None
+        file_dtype = EmbeddingDType(metadata.get("dtype", EmbeddingDType.FLOAT32.value))
+        if not metadata.get("normalized", False):
+            matrix = F.normalize(self._dequantize(matrix, scales), dim=1)
+            file_dtype, scales = EmbeddingDType.FLOAT32, None
+
+        if len(self) > 0:
+            # Merge into the existing rows one node at a time.
+            matrix = self._dequantize(matrix, scales)
+            for row, key in enumerate(keys):
+                self._add_row(key, matrix[row], self._node_kwargs(id_names[row], content_hashes[row], namespaces[row], texts[row]))
+            return None
 
-        with h5py.File(file_path, 'r') as f:
-            for key in f.keys():
-                # Decode the value from base64 and deserialize it from a byte string
-                data = pickle.loads(base64.b64decode(f[key][()]))
-                self.vector_nodes[key] = self.node_type.from_dict(data)
+        if not self._storage_dtype_fixed:
+            self.storage_dtype = file_dtype
+        elif file_dtype != self.storage_dtype:
+            matrix, scales = self._quantize(self._dequantize(matrix, scales))
+
+        self._matrix = matrix
+        self._scales = scales
+        self._pending_rows = []
+        self._keys = keys
+        self._id_names = id_names
+        self._rows_changed()
+        self._content_hashes = content_hashes
+        self._texts = texts
+        self._namespaces = namespaces
+        self._row_of = {key: row for row, key in enumerate(keys)}
+        self._lazy_rows = True
+        return metadata.get("build_id")
+
+    def _rows_changed(self):
+        """
+        Drops the caches derived from the rows. Queries that encoded their texts before the change recompute their row masks.
+        """
+        self._action_groups = None
+        self._namespace_groups = None
+        self._lexical_index = None
+        self._generation += 1
+
+    @staticmethod
+    def _node_kwargs(id_name:str=None, content_hash:str=None, namespace:str=None, text:str=None)->dict:
+        kwargs = {}
+        if id_name is not None:
+            kwargs["id_name"] = id_name
+        if content_hash is not None:
+            kwargs["content_hash"] = content_hash
+        if namespace is not None:
+            kwargs["namespace"] = namespace
+        if text is not None:
+            kwargs["text"] = text
+        return kwargs
+
+    def _node_at(self, row:int)->VectorNode:
+        """
+        Returns the node stored at a row of the search matrix, creating a view of the row if it was loaded lazily.
+        """
+        key = self._keys[row]
+        node = self._nodes.get(key)
+        if node is None:
+            node = self.node_type.view(self, row, key, id_name=self._id_names[row])
+            self._nodes[key] = node
+        return node
+
+    def _row_embedding(self, row:int)->torch.Tensor:
+        """
+        Returns the float32 embedding of a row, whether it is already in the matrix or still pending.
+        """
+        built_rows = 0 if self._matrix is None else self._matrix.shape[0]
+        if row < built_rows:
+            return self._row_embeddings(torch.tensor([row]))[0]
+        return self._pending_rows[row - built_rows]
+
+    # The node attributes kept as columns of the store for its view nodes
+    _ROW_COLUMNS = ("id_name", "content_hash", "namespace", "text")
+
+    def _set_row_attribute(self, row:int, name:str, value):
+        """
+        Updates a column of a row, for changes made through the kwargs of its view node.
+        """
+        with self._lock:
+            {"id_name": self._id_names, "content_hash": self._content_hashes,
+             "namespace": self._namespaces, "text": self._texts}[name][row] = value
+            self._rows_changed()
+
+    def _row_attributes(self, row:int)->dict:
+        """
+        Returns the attributes of a row that are stored as columns of the store rather than on its node view.
+        """
+        attributes = {}
+        if self._content_hashes[row] is not None:
+            attributes["content_hash"] = self._content_hashes[row]
+        if self._namespaces[row] is not None:
+            attributes["namespace"] = self._namespaces[row]
+        if self._texts[row] is not None:
+            attributes["text"] = self._texts[row]
+        return attributes
+
+    def _add_row(self, key, embedding:torch.Tensor, kwargs:dict):
+        """
+        Appends a row for a new key and stores a view node for it, so the embedding is only kept in the store.
+        Existing keys are replaced in place.
+        """
+        with self._lock:
+            if key in self._row_of:
+                self._nodes[key] = self.node_type(key, embedding, **kwargs)
+                self._index_node(self._nodes[key])
+                return
+
+            extra = dict(kwargs)
+            id_name = extra.pop("id_name", None)
+            content_hash = extra.pop("content_hash", None)
+            namespace = extra.pop("namespace", None)
+            text = extra.pop("text", None)
+            row = len(self._keys)
+            self._row_of[key] = row
+            self._keys.append(key)
+            self._id_names.append(id_name)
+            self._content_hashes.append(content_hash)
+            self._texts.append(text)
+            self._namespaces.append(namespace)
+            self._rows_changed()
+            self._pending_rows.append(self._normalize_embedding(embedding))
+            self._nodes[key] = self.node_type.view(self, row, key, id_name=id_name, extra=extra)
     
     def integrate_databases(self, source_db):
         """
@@ -213,8 +754,122 @@ class VectorStore:
             raise ValueError("Cannot integrate a database with itself")
 
         for key, node in source_db.vector_nodes.items():
-            self.vector_nodes[key] = node
-    
+            self._add_row(key, node.embedding, node.kwargs)
+
+    @property
+    def catalogs(self)->List[str]:
+        """
+        The namespaces of the catalogs in the store, in the order they were added.
+        """
+        return list(dict.fromkeys(namespace for namespace in self._namespaces if namespace is not None))
+
+    @staticmethod
+    def _namespaced_key(namespace:str, key)->str:
+        return f"{namespace}/{key}"
+
+    def add_catalog(self, namespace:str, source):
+        """
+        Adds a catalog of actions under a namespace. Its rows are appended to the shared search matrix, and the query
+        methods can be restricted to it (or to a set of catalogs) with their namespaces argument.
+        Keys are prefixed with the namespace, so catalogs may reuse keys and action names. An existing catalog with the
+        same namespace is replaced.
+
+        Args:
+            namespace (str): The name of the catalog.
+            source (str | VectorStore): The embeddings file (name or path) of the catalog, or a store holding it.
+        """
+        if not namespace:
+            raise ValueError("A catalog needs a non-empty namespace")
+        if source is self:
+            raise ValueError("Cannot add a database to itself as a catalog")
+        if isinstance(source, VectorStore):
+            catalog = source
+        else:
+            catalog = VectorStore(embedding_model=self.embedding_model, node_type=self.node_type)
+            catalog.load(source)
+
+        with self._lock:
+            if namespace in self.catalogs:
+                self.remove_catalog(namespace)
+
+            matrix = catalog._get_matrix()
+            if matrix is None:
+                return
+            embeddings = catalog._dequantize(matrix, catalog._scales)
+            for row, key in enumerate(catalog._keys):
+                kwargs = dict(catalog._node_at(row).kwargs, namespace=namespace)
+                self._add_row(self._namespaced_key(namespace, key), embeddings[row], kwargs)
+            # Append the rows to the matrix now rather than in the first query
+            self._get_matrix()
+
+    def remove_catalog(self, namespace:str):
+        """
+        Removes the rows of a catalog from the store. The matrix is compacted, so the memory of the catalog is freed.
+        """
+        with self._lock:
+            self._get_matrix()
+            keep = [row for row, row_namespace in enumerate(self._namespaces) if row_namespace != namespace]
+            if len(keep) == len(self._keys):
+                raise ValueError(f"Unknown catalog namespace: {namespace}")
+            self._keep_rows(keep)
+
+    def _keep_rows(self, keep:List[int]):
+        """
+        Drops every row of the (built) search matrix that is not in keep, along with its node.
+        """
+        with self._lock:
+            kept = set(keep)
+            for row, key in enumerate(self._keys):
+                if row not in kept:
+                    node = self._nodes.pop(key, None)
+                    if node is not None and getattr(node, "_store", None) is self:
+                        # Detach the removed view from its row, which is about to be reused
+                        kwargs = node._kwargs_dict()
+                        node.embedding = self._row_embedding(row)
+                        node.kwargs = kwargs
+
+            if len(keep) == 0:
+                self._matrix, self._scales = None, None
+            else:
+                rows = torch.tensor(keep, dtype=torch.long)
+                self._matrix = self._matrix[rows]
+                if self._scales is not None:
+                    self._scales = self._scales[rows]
+            self._keys = [self._keys[row] for row in keep]
+            self._id_names = [self._id_names[row] for row in keep]
+            self._content_hashes = [self._content_hashes[row] for row in keep]
+            self._namespaces = [self._namespaces[row] for row in keep]
+            self._texts = [self._texts[row] for row in keep]
+            self._row_of = {key: row for row, key in enumerate(self._keys)}
+            self._rows_changed()
+            for row, key in enumerate(self._keys):
+                node = self._nodes.get(key)
+                if node is not None and getattr(node, "_store", None) is self:
+                    node._row = row
+            if self.index is not None:
+                self.index.reset()
+
+    def _namespace_mask(self, namespaces)->torch.Tensor:
+        """
+        Returns a boolean mask of the rows that belong to the given namespace(s), or None to search every row.
+        """
+        if namespaces is None:
+            return None
+        if isinstance(namespaces, str):
+            namespaces = [namespaces]
+        if self._namespace_groups is None or len(self._namespace_groups[0]) != len(self._namespaces):
+            namespace_index = {namespace: i for i, namespace in enumerate(dict.fromkeys(self._namespaces))}
+            row_namespaces = torch.tensor([namespace_index[namespace] for namespace in self._namespaces], dtype=torch.long)
+            self._namespace_groups = (row_namespaces, namespace_index)
+
+        row_namespaces, namespace_index = self._namespace_groups
+        unknown = [namespace for namespace in namespaces if namespace not in namespace_index]
+        if unknown:
+            raise ValueError(f"Unknown catalog namespace(s): {', '.join(map(str, unknown))}")
+        selected = torch.zeros(len(namespace_index), dtype=torch.bool)
+        selected[[namespace_index[namespace] for namespace in namespaces]] = True
+        return selected[row_namespaces]
+
 
     def preprocess_text(self, text, threshold_length=200):
         """
@@ -233,7 +888,65 @@ class VectorStore:
     def vectorize_text(self, text):
         embedding = self.embedding_model.compute_sentence_embeddings(text)
         return embedding
+
+    def vectorize_texts(self, texts:List[str], batch_size=32)->torch.Tensor:
+        """
+        Vectorizes a list of texts, returning a (N x D) tensor.
+        """
+        return self.embedding_model.compute_sentence_embeddings(list(texts), batch_size=batch_size)
     
+    def _query_cache_key(self, text:str):
+        return (self.embedding_model.model_source.name, self.embedding_model.model_identifier, " ".join(text.split()))
+
+    def _encode_queries(self, texts:List[str])->torch.Tensor:
+        if self.batcher is not None:
+            return torch.stack(self.batcher.encode_many(texts))
+        return self.vectorize_texts(texts)
+
+    def _cached_queries(self, texts:List[str]):
+        """
+        Returns the cache keys, the cached embeddings (None on a miss) and the indices of the misses.
+        """
+        cache_keys = [self._query_cache_key(text) for text in texts]
+        embeddings = [self.query_cache.get(cache_key) for cache_key in cache_keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        return cache_keys, embeddings, missing
+
+    def _fill_cache(self, cache_keys, embeddings, missing, computed)->torch.Tensor:
+        for i, embedding in zip(missing, computed):
+            embeddings[i] = embedding.detach().to("cpu", torch.float32).clone()
+            self.query_cache.put(cache_keys[i], embeddings[i])
+        return torch.stack(embeddings)
+
+    def vectorize_queries(self, texts:List[str])->torch.Tensor:
+        """
+        Vectorizes query texts into a (N x D) tensor, reusing cached embeddings of previously seen queries.
+        Only the texts that miss the cache are sent to the embedding model, in a single call
+        (or through the micro-batcher, together with other callers' texts).
+        """
+        if self.query_cache is None:
+            return self._encode_queries(texts)
+
+        cache_keys, embeddings, missing = self._cached_queries(texts)
+        computed = self._encode_queries([texts[i] for i in missing]) if missing else []
+        return self._fill_cache(cache_keys, embeddings, missing, computed)
+
+    async def avectorize_queries(self, texts:List[str])->torch.Tensor:
+        """
+        Same as vectorize_queries, without blocking the event loop while the texts are encoded.
+        """
+        if self.batcher is not None:
+            encode = lambda batch: self.batcher.aencode_many(batch)
+        else:
+            encode = lambda batch: asyncio.to_thread(self.vectorize_texts, batch)
+
+        if self.query_cache is None:
+            return torch.stack(list(await encode(texts)))
+
+        cache_keys, embeddings, missing = self._cached_queries(texts)
+        computed = list(await encode([texts[i] for i in missing])) if missing else []
+        return self._fill_cache(cache_keys, embeddings, missing, computed)
+
     def add_vector(self, text,key=None, **kwargs):
         """
         Adds a vector to the database.
@@ -244,16 +957,645 @@ class VectorStore:
             summary (list, optional): The summary associated with the vector. Defaults to None.
         """
         if key is None:
-            key = str(len(self.vector_nodes))
+            key = str(len(self))
+        kwargs.setdefault("text", text)
 
         preprocess_text = self.preprocess_text(text, threshold_length=100)
         vector_emb = self.vectorize_text(preprocess_text)
-        self.vector_nodes[key] = self.node_type(key, vector_emb,**kwargs)
-    
-    def query(self, text, k=5,**kwargs):
-        query_emb = self.vectorize_text(text)
+        self._add_row(key, vector_emb, kwargs)
+
+    def encode_texts(self, texts:List[str], batch_size=64, show_progress=False)->torch.Tensor:
+        """
+        Encodes texts in batches into a (N x D) tensor, without adding them to the database.
+
+        Args:
+            texts (List[str]): The texts to vectorize.
+            batch_size (int, optional): The number of texts to encode per call to the embedding model. Defaults to 64.
+            show_progress (bool, optional): If True, prints the progress and throughput after each batch. Defaults to False.
+        """
+        texts = [self.preprocess_text(text, threshold_length=100) for text in texts]
+        batches = []
+        start_time = time.perf_counter()
+        for start in range(0, len(texts), batch_size):
+            end = min(start + batch_size, len(texts))
+            batches.append(self.vectorize_texts(texts[start:end], batch_size=batch_size).detach().to("cpu", torch.float32))
+
+            if show_progress:
+                elapsed = time.perf_counter() - start_time
+                print(f"Encoded {end}/{len(texts)} texts ({end / max(elapsed, 1e-9):.1f} texts/s)")
+        return torch.cat(batches) if batches else torch.zeros((0, 0))
+
+    def add_embeddings(self, embeddings:torch.Tensor, keys:List[str]=None, metadata:List[dict]=None):
+        """
+        Adds precomputed embeddings to the database.
+
+        Args:
+            embeddings (torch.Tensor): The (N x D) embeddings.
+            keys (List[str], optional): Unique keys for the embeddings. Defaults to consecutive integers continuing from the current size.
+            metadata (List[dict], optional): Extra attributes (e.g. id_name) for each node. Defaults to None.
+        """
+        if keys is None:
+            keys = [str(len(self) + i) for i in range(len(embeddings))]
+        if metadata is None:
+            metadata = [{} for _ in keys]
+        if not (len(embeddings) == len(keys) == len(metadata)):
+            raise ValueError("embeddings, keys and metadata must have the same length")
+
+        with self._lock:
+            for key, embedding, kwargs in zip(keys, embeddings, metadata):
+                self._add_row(key, embedding, kwargs)
+
+    def add_vectors(self, texts:List[str], keys:List[str]=None, metadata:List[dict]=None, batch_size=64, show_progress=False):
+        """
+        Adds many vectors to the database, encoding the texts in batches instead of one forward pass per text.
+
+        Args:
+            texts (List[str]): The texts to vectorize and add to the database.
+            keys (List[str], optional): Unique keys for the texts. Defaults to consecutive integers continuing from the current size.
+            metadata (List[dict], optional): Extra attributes (e.g. id_name) for each node. Defaults to None.
+            batch_size (int, optional): The number of texts to encode per call to the embedding model. Defaults to 64.
+            show_progress (bool, optional): If True, prints the progress and throughput after each batch. Defaults to False.
+        """
+        if not (keys is None or len(keys) == len(texts)) or not (metadata is None or len(metadata) == len(texts)):
+            raise ValueError("texts, keys and metadata must have the same length")
+        embeddings = self.encode_texts(texts, batch_size=batch_size, show_progress=show_progress)
+        metadata = [dict({"text": text}, **kwargs) for text, kwargs in zip(texts, metadata or [{} for _ in texts])]
+        self.add_embeddings(embeddings, keys=keys, metadata=metadata)
+
+    def content_hash(self, text:str)->str:
+        """
+        Returns a hash of the embedding model and the text, used to detect texts whose embeddings can be reused.
+        """
+        content = f"{self.embedding_model.model_source.name}:{self.embedding_model.model_identifier}\0{text}"
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+    def embeddings_by_content_hash(self)->Dict[str, torch.Tensor]:
+        """
+        Returns the float32 embedding of every row that has a content hash, by hash.
+        """
+        with self._lock:
+            matrix = self._get_matrix()
+            rows = [row for row, content_hash in enumerate(self._content_hashes) if content_hash is not None]
+            if matrix is None or len(rows) == 0:
+                return {}
+            embeddings = self._row_embeddings(torch.tensor(rows))
+            return {self._content_hashes[row]: embedding for row, embedding in zip(rows, embeddings)}
+
+    @staticmethod
+    def _normalize_embedding(embedding:torch.Tensor)->torch.Tensor:
+        """
+        Returns the embedding as a flat, L2-normalized float32 tensor on the CPU.
+        """
+        return F.normalize(embedding.detach().to("cpu", torch.float32).reshape(-1), dim=0)
+
+    def _index_node(self, node:VectorNode):
+        """
+        Adds (or replaces) the row of a node in the search matrix.
+        """
+        with self._lock:
+            embedding = self._normalize_embedding(node.embedding)
+            row = self._row_of.get(node.key)
+            if row is None:
+                self._row_of[node.key] = len(self._keys)
+                self._keys.append(node.key)
+                self._id_names.append(getattr(node, "id_name", None))
+                self._rows_changed()
+                self._content_hashes.append(getattr(node, "content_hash", None))
+                self._namespaces.append(getattr(node, "namespace", None))
+                self._texts.append(getattr(node, "text", None))
+                self._pending_rows.append(embedding)
+                return
+
+            self._id_names[row] = getattr(node, "id_name", None)
+            self._rows_changed()
+            self._content_hashes[row] = getattr(node, "content_hash", None)
+            self._namespaces[row] = getattr(node, "namespace", None)
+            self._texts[row] = getattr(node, "text", None)
+            built_rows = 0 if self._matrix is None else self._matrix.shape[0]
+            if row < built_rows:
+                quantized, scales = self._quantize(embedding.reshape(1, -1))
+                self._matrix[row] = quantized[0]
+                if scales is not None:
+                    self._scales[row] = scales[0]
+            else:
+                self._pending_rows[row - built_rows] = embedding
+
+    def _quantize(self, embeddings:torch.Tensor, storage_dtype:EmbeddingDType=None):
+        """
+        Converts normalized float32 rows to the storage dtype (self.storage_dtype unless given).
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: The converted rows and, for INT8, the per-row scales (otherwise None).
+        """
+        storage_dtype = storage_dtype or self.storage_dtype
+        if storage_dtype == EmbeddingDType.FLOAT16:
+            return embeddings.half().contiguous(), None
+        if storage_dtype == EmbeddingDType.INT8:
+            scales = embeddings.abs().amax(dim=1).clamp(min=1e-12) / 127
+            quantized = torch.round(embeddings / scales[:, None]).clamp(-127, 127).to(torch.int8)
+            return quantized.contiguous(), scales.float()
+        return embeddings.float().contiguous(), None
+
+    @staticmethod
+    def _dequantize(matrix:torch.Tensor, scales:torch.Tensor=None)->torch.Tensor:
+        matrix = matrix.float()
+        return matrix * scales[:, None] if scales is not None else matrix
+
+    def _row_embeddings(self, rows:torch.Tensor)->torch.Tensor:
+        """
+        Returns the float32 embeddings of the given rows of the (already built) search matrix.
+        """
+        return self._dequantize(self._matrix[rows], None if self._scales is None else self._scales[rows])
+
+    def convert_storage(self, storage_dtype:EmbeddingDType):
+        """
+        Converts the stored matrix to another precision.
+        """
+        with self._lock:
+            matrix = self._get_matrix()
+            dequantized = None if matrix is None else self._dequantize(matrix, self._scales)
+            self.storage_dtype = storage_dtype
+            self._storage_dtype_fixed = True
+            if dequantized is not None:
+                self._matrix, self._scales = self._quantize(dequantized)
+            if self.index is not None:
+                self.index.reset()
+
+    def quantization_report(self, storage_dtype:EmbeddingDType, k=5, n_samples=200, seed=0)->Dict[str, float]:
+        """
+        Measures how storing the matrix in another precision changes search results, using the stored rows
+        (the action descriptions and examples) as queries. Each query's own row is left out of its results.
+
+        Args:
+            storage_dtype (EmbeddingDType): The precision to compare against the current one (normally FLOAT32).
+            k (int, optional): The number of results to compare per query. Defaults to 5.
+            n_samples (int, optional): The number of stored rows to use as queries. Defaults to 200.
+            seed (int, optional): Seed for the sampling. Defaults to 0.
+
+        Returns:
+            Dict[str, float]: Memory of both matrices in bytes, top-1 action agreement, recall@k and the mean/max absolute score delta.
+                A store with a single row has no results to compare, so only the memory and score deltas are reported.
+        """
+        matrix = self._get_matrix()
+        if matrix is None:
+            raise ValueError("Cannot compute a quantization report on an empty store")
+        if self.storage_dtype != EmbeddingDType.FLOAT32:
+            print(f"Warning: the reference matrix is stored as {self.storage_dtype.value}, not float32")
+
+        reference = self._dequantize(matrix, self._scales)
+        quantized, scales = self._quantize(reference, storage_dtype)
+        generator = torch.Generator().manual_seed(seed)
+        sample = torch.randperm(reference.shape[0], generator=generator)[:n_samples]
+        queries = reference[sample]
+
+        exact_scores = queries @ reference.T
+        quantized_scores = queries @ self._dequantize(quantized, scales).T
+        score_delta = (quantized_scores - exact_scores).abs()
+        reference_bytes = matrix.numel() * matrix.element_size() + (0 if self._scales is None else self._scales.numel() * self._scales.element_size())
+        quantized_bytes = quantized.numel() * quantized.element_size() + (0 if scales is None else scales.numel() * scales.element_size())
+        report = {"dtype": storage_dtype.value,
+                  "reference_bytes": reference_bytes,
+                  "quantized_bytes": quantized_bytes,
+                  "mean_abs_score_delta": score_delta.mean().item(),
+                  "max_abs_score_delta": score_delta.max().item()}
+        # A query's own row is left out of its results, so a single row has nothing to rank
+        if reference.shape[0] < 2:
+            return report
+
+        own_rows = (torch.arange(sample.shape[0]), sample)
+        exact_scores[own_rows] = float("-inf")
+        quantized_scores[own_rows] = float("-inf")
+
+        k = min(k, reference.shape[0] - 1)
+        exact_top = torch.topk(exact_scores, k=k, dim=1).indices.tolist()
+        quantized_top = torch.topk(quantized_scores, k=k, dim=1).indices.tolist()
+        report["top1_action_agreement"] = sum(self._id_names[exact[0]] == self._id_names[approx[0]]
+                                              for exact, approx in zip(exact_top, quantized_top)) / len(exact_top)
+        report[f"recall@{k}"] = sum(len(set(exact) & set(approx)) for exact, approx in zip(exact_top, quantized_top)) / (k * len(exact_top))
+        return report
+
+    def _rebuild_matrix(self):
+        """
+        Rebuilds the search matrix and the key/id_name arrays from the stored nodes.
+        """
+        with self._lock:
+            nodes = self._materialized_nodes()
+            # Read everything from the nodes first: views still point at the old rows
+            id_names = [getattr(node, "id_name", None) for node in nodes.values()]
+            content_hashes = [getattr(node, "content_hash", None) for node in nodes.values()]
+            namespaces = [getattr(node, "namespace", None) for node in nodes.values()]
+            texts = [getattr(node, "text", None) for node in nodes.values()]
+            embeddings = [node.embedding.detach().to("cpu", torch.float32).reshape(-1) for node in nodes.values()]
+
+            self._keys = list(nodes.keys())
+            self._id_names = id_names
+            self._rows_changed()
+            self._content_hashes = content_hashes
+            self._namespaces = namespaces
+            self._texts = texts
+            self._row_of = {key: row for row, key in enumerate(self._keys)}
+            self._pending_rows = []
+            if len(self._keys) == 0:
+                self._matrix, self._scales = None, None
+                return
+            self._matrix, self._scales = self._quantize(F.normalize(torch.stack(embeddings), dim=1))
+            for row, node in enumerate(nodes.values()):
+                if getattr(node, "_store", None) is self:
+                    node._row = row
+
+    def _get_matrix(self)->torch.Tensor:
+        """
+        Returns the (N x D) search matrix, appending any rows added since the last call.
+        The matrix is in the storage dtype; use self._scales to dequantize INT8 rows.
+        """
+        with self._lock:
+            if self._pending_rows:
+                new_rows, new_scales = self._quantize(torch.stack(self._pending_rows))
+                self._pending_rows = []
+                if self._matrix is None:
+                    self._matrix, self._scales = new_rows, new_scales
+                else:
+                    self._matrix = torch.cat([self._matrix, new_rows])
+                    if new_scales is not None:
+                        self._scales = torch.cat([self._scales, new_scales])
+            return self._matrix
+
+    # Rows scored per block when the matrix has to be cast to float32 first, to bound the temporary memory.
+    _SCORE_BLOCK_ROWS = 65536
+
+    def _score_rows(self, query_embs:torch.Tensor, rows:torch.Tensor=None)->torch.Tensor:
+        """
+        Scores a (B x D) batch of normalized queries directly against the stored matrix, or a subset of its rows.
+
+        Returns:
+            torch.Tensor: The (B x R) cosine similarity scores.
+        """
+        matrix = self._get_matrix()
+        n_rows = matrix.shape[0] if rows is None else rows.shape[0]
+        if matrix.dtype == torch.float32:
+            return query_embs @ (matrix if rows is None else matrix[rows]).T
+
+        blocks = []
+        for start in range(0, n_rows, self._SCORE_BLOCK_ROWS):
+            block_rows = slice(start, start + self._SCORE_BLOCK_ROWS) if rows is None else rows[start:start + self._SCORE_BLOCK_ROWS]
+            block_scores = query_embs @ matrix[block_rows].float().T
+            if self._scales is not None:
+                block_scores *= self._scales[block_rows]
+            blocks.append(block_scores)
+        return torch.cat(blocks, dim=1) if blocks else query_embs.new_zeros((query_embs.shape[0], 0))
+
+    def _search(self, query_emb:torch.Tensor, k=5, namespaces=None):
+        """
+        Scores a query embedding against every stored node with a single matrix-vector product.
+
+        Returns:
+            List[Tuple[VectorNode, float]]: The top k nodes and their cosine similarity scores.
+        """
+        return self._search_batch(query_emb.reshape(1, -1), k=k, namespaces=namespaces)[0]
+
+    def _exact_top_rows(self, query_embs:torch.Tensor, k=5, row_mask:torch.Tensor=None):
+        scores = self._score_rows(query_embs)
+        if row_mask is not None:
+            scores.masked_fill_(~row_mask, float("-inf"))
+            k = min(k, int(row_mask.sum()))
+        top = torch.topk(scores, k=min(k, scores.shape[1]), dim=1)
+        return top.values.tolist(), top.indices.tolist()
+
+    def _top_rows(self, query_embs:torch.Tensor, k=5, namespaces=None):
+        """
+        Returns the scores and row ids of the top k rows for each of a (B x D) batch of query embeddings,
+        optionally only among the rows of the given namespace(s).
+        """
+        matrix = self._get_matrix()
+        if matrix is None:
+            return [[] for _ in range(query_embs.shape[0])], [[] for _ in range(query_embs.shape[0])]
+        query_embs = F.normalize(query_embs.detach().to("cpu", torch.float32).reshape(-1, matrix.shape[1]), dim=1)
+        row_mask = self._namespace_mask(namespaces)
+
+        if self.index is None:
+            return self._exact_top_rows(query_embs, k=k, row_mask=row_mask)
+
+        self._build_index_if_needed()
+        return self.index.search(self._score_rows, query_embs, matrix.shape[0], k=k, row_mask=row_mask)
+
+    def _build_index_if_needed(self):
+        with self._lock:
+            matrix = self._get_matrix()
+            if self.index is not None and matrix is not None and self.index.needs_rebuild(matrix.shape[0]):
+                self.index.build(self._dequantize(matrix, self._scales))
+
+    def _search_batch(self, query_embs:torch.Tensor, k=5, namespaces=None):
+        """
+        Scores a (B x D) batch of query embeddings against the stored nodes, with a single matrix-matrix product for exact search.
+
+        Returns:
+            List[List[Tuple[VectorNode, float]]]: For each query, the top k nodes and their cosine similarity scores.
+        """
+        with self._lock:
+            scores, rows = self._top_rows(query_embs, k=k, namespaces=namespaces)
+            return [[(self._node_at(row), score) for score, row in zip(row_scores, row_ids)]
+                    for row_scores, row_ids in zip(scores, rows)]
+
+    def evaluate_recall(self, queries:List[str]=None, k=5, n_samples=100, seed=0)->Dict[str, float]:
+        """
+        Compares the configured index against exact search.
+
+        Args:
+            queries (List[str], optional): Query texts to evaluate with. Defaults to a random sample of the stored embeddings
+                (which includes each query's own row, so it slightly overestimates recall).
+            k (int, optional): The number of results to compare per query. Defaults to 5.
+            n_samples (int, optional): The number of stored embeddings to sample when no queries are given. Defaults to 100.
+            seed (int, optional): Seed for the sampling. Defaults to 0.
+
+        Returns:
+            Dict[str, float]: recall@k, and the total exact and approximate search time in milliseconds.
+        """
+        matrix = self._get_matrix()
+        if matrix is None:
+            raise ValueError("Cannot evaluate recall on an empty store")
+        if queries is None:
+            generator = torch.Generator().manual_seed(seed)
+            sample = torch.randperm(matrix.shape[0], generator=generator)[:n_samples]
+            query_embs = self._row_embeddings(sample)
+        else:
+            query_embs = F.normalize(self.vectorize_texts(queries).to("cpu", torch.float32), dim=1)
+
+        self._build_index_if_needed()
+
+        start_time = time.perf_counter()
+        _, exact_rows = self._exact_top_rows(query_embs, k=k)
+        exact_ms = (time.perf_counter() - start_time) * 1000
+
+        start_time = time.perf_counter()
+        _, approx_rows = self._top_rows(query_embs, k=k)
+        approx_ms = (time.perf_counter() - start_time) * 1000
+
+        hits = sum(len(set(exact) & set(approx)) for exact, approx in zip(exact_rows, approx_rows))
+        total = sum(len(exact) for exact in exact_rows)
+        return {"recall": hits / max(total, 1), "k": k, "n_queries": len(exact_rows),
+                "exact_ms": exact_ms, "approx_ms": approx_ms}
+
+    def query(self, text, k=5, namespaces=None, **kwargs):
+        """
+        Returns the k nodes most similar to the text.
 
-        hits = self.embedding_model.semantic_search(query_emb,list(self.vector_nodes.values()), top_k=k, **kwargs)
+        Args:
+            text (str): The query text.
+            k (int, optional): The number of results to return. Defaults to 5.
+            namespaces (str | List[str], optional): Only search the rows of these catalogs. Defaults to None (every row).
+
+        Returns:
+            List[Tuple[VectorNode, float]]: The list of VectorNode objects and their cosine similarity scores.
+        """
+        query_emb = self.vectorize_queries([text])[0]
+
+        hits = self._search(query_emb, k=k, namespaces=namespaces)
 
         return hits
-    
\ No newline at end of file
+
+    def query_batch(self, texts:List[str], k=5, namespaces=None):
+        """
+        Returns the k nodes most similar to each text, encoding all texts in one call and scoring them with one matrix product.
+
+        Args:
+            texts (List[str]): The query texts.
+            k (int, optional): The number of results to return per text. Defaults to 5.
+            namespaces (str | List[str], optional): Only search the rows of these catalogs. Defaults to None (every row).
+
+        Returns:
+            List[List[Tuple[VectorNode, float]]]: For each text, the list of VectorNode objects and their cosine similarity scores.
+        """
+        if len(texts) == 0:
+            return []
+        query_embs = self.vectorize_queries(texts)
+
+        return self._search_batch(query_embs, k=k, namespaces=namespaces)
+
+    async def aquery_batch(self, texts:List[str], k=5, namespaces=None):
+        """
+        Same as query_batch, without blocking the event loop while the texts are encoded and scored.
+        """
+        if len(texts) == 0:
+            return []
+        query_embs = await self.avectorize_queries(texts)
+
+        return await asyncio.to_thread(self._search_batch, query_embs, k, namespaces)
+
+    def _get_action_groups(self):
+        """
+        Returns a tensor mapping each row to the index of its action (id_name) and the list of action names.
+        Actions of different catalogs are kept apart, even if they have the same name.
+        Rows without an id_name are mapped to the extra index len(action_names).
+        """
+        if self._action_groups is None or len(self._action_groups[0]) != len(self._id_names):
+            actions = list(dict.fromkeys((namespace, name) for namespace, name in zip(self._namespaces, self._id_names) if name is not None))
+            action_index = {action: i for i, action in enumerate(actions)}
+            row_actions = torch.tensor([action_index.get(action, len(actions)) for action in zip(self._namespaces, self._id_names)],
+                                       dtype=torch.long)
+            self._action_groups = (row_actions, [name for _, name in actions])
+        return self._action_groups
+
+    def _candidate_row_scores(self, query_embs:torch.Tensor, row_mask:torch.Tensor=None):
+        """
+        Scores normalized queries against the rows they can match.
+
+        Returns:
+            Without an ANN index, the (B x N) scores against every row (-inf outside row_mask) and None. With one, a list of
+            (R,) score tensors, one per query, and the list of the (R,) candidate row ids they belong to, so that the cost
+            of scoring and pooling grows with the candidates instead of N.
+        """
+        if self.index is None:
+            scores = self._score_rows(query_embs)
+            return (scores if row_mask is None else scores.masked_fill_(~row_mask, float("-inf"))), None
+
+        self._build_index_if_needed()
+        n_rows = self._get_matrix().shape[0]
+        rows = [self.index.candidate_rows(query_emb, n_rows, row_mask=row_mask) for query_emb in query_embs]
+        scores = [self._score_rows(query_emb.reshape(1, -1), candidates)[0] for query_emb, candidates in zip(query_embs, rows)]
+        return scores, rows
+
+    def _get_lexical_index(self)->LexicalIndex:
+        """
+        Returns the lexical index over the stored texts, or None if no row has a text.
+        """
+        if self._lexical_index is None or self._lexical_index.n_rows != len(self._texts):
+            if all(text is None for text in self._texts):
+                return None
+            self._lexical_index = LexicalIndex(**self.lexical_params)
+            self._lexical_index.build(self._texts)
+        return self._lexical_index
+
+    def lexical_scores(self, texts:List[str], row_mask:torch.Tensor=None)->torch.Tensor:
+        """
+        Returns the (B x N) character n-gram scores of the texts against every row, without using the embedding model.
+        Rows without a stored text score 0, rows outside row_mask -inf. Returns None if no row has a text.
+        """
+        with self._lock:
+            self._get_matrix()
+            lexical_index = self._get_lexical_index()
+            if lexical_index is None:
+                return None
+            scores = torch.from_numpy(lexical_index.score(texts))
+            return scores if row_mask is None else scores.masked_fill_(~row_mask, float("-inf"))
+
+    def _pool_actions(self, scores, k=5, threshold:float=None, pooling="max", rows=None):
+        """
+        Pools row scores per action and returns the top k actions above the threshold for each query.
+        scores is either a (B x N) tensor of the scores against every row, or, with rows, a list of (R,) score tensors
+        for the row ids in rows (see _candidate_row_scores), in which case only those rows are pooled.
+        """
+        row_actions, action_names = self._get_action_groups()
+        n_groups = len(action_names) + 1
+
+        if rows is None:
+            pooled = self._pool_rows(scores, row_actions.expand(scores.shape[0], -1), n_groups, pooling)
+        elif len(rows) == 0:
+            pooled = torch.full((0, n_groups), float("-inf"))
+        else:
+            pooled = torch.cat([self._pool_rows(row_scores.reshape(1, -1), row_actions[candidates].reshape(1, -1), n_groups, pooling)
+                                for row_scores, candidates in zip(scores, rows)])
+
+        # Drop the group of rows without an id_name
+        pooled = pooled[:, :len(action_names)]
+        if threshold is not None:
+            pooled = torch.where(pooled > threshold, pooled, torch.full_like(pooled, float("-inf")))
+
+        top = torch.topk(pooled, k=min(k, pooled.shape[1]), dim=1)
+        return [[(action_names[action], score) for score, action in zip(action_scores, actions) if score != float("-inf")]
+                for action_scores, actions in zip(top.values.tolist(), top.indices.tolist())]
+
+    @staticmethod
+    def _pool_rows(scores:torch.Tensor, row_actions:torch.Tensor, n_groups:int, pooling="max")->torch.Tensor:
+        """
+        Pools (B x R) row scores into (B x n_groups) action scores, given the (B x R) action index of each score.
+        """
+        if pooling == "max":
+            pooled = torch.full((scores.shape[0], n_groups), float("-inf"))
+            return pooled.scatter_reduce(1, row_actions, scores, reduce="amax", include_self=True)
+
+        scored = torch.isfinite(scores)
+        sums = torch.zeros((scores.shape[0], n_groups)).scatter_add(1, row_actions, torch.where(scored, scores, torch.zeros_like(scores)))
+        counts = torch.zeros((scores.shape[0], n_groups)).scatter_add(1, row_actions, scored.float())
+        return torch.where(counts > 0, sums / counts.clamp(min=1), torch.full_like(sums, float("-inf")))
+
+    def query_actions_batch(self, texts:List[str], k=5, threshold:float=None, pooling="max", namespaces=None,
+                            lexical_threshold:float=None):
+        """
+        Returns the k best distinct actions (id_names) for each text. Example scores are pooled per action on the
+        vectorized path and the threshold is applied before the top k, so no over-fetching or deduplication is needed.
+        With lexical_weight set, the scores of rows with a stored text are fused with their character n-gram scores.
+
+        Args:
+            texts (List[str]): The query texts.
+            k (int, optional): The number of distinct actions to return per text. Defaults to 5.
+            threshold (float, optional): Only actions whose pooled score is above the threshold are returned. Defaults to None.
+            pooling (str, optional): "max" scores an action by its best matching example, "mean" by the average over its examples. Defaults to "max".
+            namespaces (str | List[str], optional): Only return actions of these catalogs. Defaults to None (every catalog).
+            lexical_threshold (float, optional): Texts whose best lexical row score reaches this value are answered from the
+                lexical scores alone, without calling the embedding model. Defaults to None (every text is encoded).
+
+        Returns:
+            List[List[Tuple[str, float]]]: For each text, the list of action names and their pooled scores, best first.
+        """
+        if pooling not in ("max", "mean"):
+            raise ValueError(f"Unsupported pooling: {pooling}. Use 'max' or 'mean'.")
+        results, remaining, state = self._lexical_stage(texts, k, threshold, pooling, namespaces, lexical_threshold)
+        if not remaining:
+            return results
+        # Encoded without holding the lock, so concurrent queries can share micro-batches
+        query_embs = self.vectorize_queries([texts[i] for i in remaining])
+        return self._semantic_stage(texts, query_embs, results, remaining, state, k, threshold, pooling, namespaces)
+
+    async def aquery_actions_batch(self, texts:List[str], k=5, threshold:float=None, pooling="max", namespaces=None,
+                                   lexical_threshold:float=None):
+        """
+        Same as query_actions_batch, without blocking the event loop. The texts are encoded with avectorize_queries
+        (through the micro-batcher if there is one) and the scoring stages run in a worker thread.
+        """
+        if pooling not in ("max", "mean"):
+            raise ValueError(f"Unsupported pooling: {pooling}. Use 'max' or 'mean'.")
+        results, remaining, state = await asyncio.to_thread(self._lexical_stage, texts, k, threshold, pooling, namespaces,
+                                                            lexical_threshold)
+        if not remaining:
+            return results
+        query_embs = await self.avectorize_queries([texts[i] for i in remaining])
+        return await asyncio.to_thread(self._semantic_stage, texts, query_embs, results, remaining, state, k, threshold,
+                                       pooling, namespaces)
+
+    def _lexical_stage(self, texts:List[str], k, threshold, pooling, namespaces, lexical_threshold):
+        """
+        First stage of query_actions_batch: answers the texts whose lexical scores reach lexical_threshold.
+
+        Returns:
+            The results so far (None for unanswered texts), the indices of the texts left to encode, and the
+            (generation, row mask, lexical scores) the semantic stage continues from.
+        """
+        with self._lock:
+            if self._get_matrix() is None:
+                return [[] for _ in texts], [], None
+
+            row_mask = self._namespace_mask(namespaces)
+            lexical_scores = None
+            if self.lexical_weight > 0 or lexical_threshold is not None:
+                lexical_scores = self.lexical_scores(texts, row_mask=row_mask)
+
+            results = [None] * len(texts)
+            remaining = list(range(len(texts)))
+            if lexical_scores is not None and lexical_threshold is not None:
+                confident = (lexical_scores.amax(dim=1) >= lexical_threshold).tolist()
+                answered = [i for i in remaining if confident[i]]
+                if answered:
+                    for i, hits in zip(answered, self._pool_actions(lexical_scores[answered], k=k, threshold=threshold, pooling=pooling)):
+                        results[i] = hits
+                remaining = [i for i in remaining if not confident[i]]
+            return results, remaining, (self._generation, row_mask, lexical_scores)
+
+    def _semantic_stage(self, texts:List[str], query_embs:torch.Tensor, results, remaining, state, k, threshold, pooling, namespaces):
+        """
+        Second stage of query_actions_batch: scores the encoded remaining texts, fused with their lexical scores, and pools them per action.
+        """
+        generation, row_mask, lexical_scores = state
+        query_embs = F.normalize(query_embs.to("cpu", torch.float32).reshape(len(remaining), -1), dim=1)
+        with self._lock:
+            if self._generation != generation:
+                # Rows were added or removed while the texts were encoded
+                if self._get_matrix() is None:
+                    for i in remaining:
+                        results[i] = []
+                    return results
+                row_mask = self._namespace_mask(namespaces)
+                if lexical_scores is not None:
+                    lexical_scores = self.lexical_scores(texts, row_mask=row_mask)
+
+            scores, rows = self._candidate_row_scores(query_embs, row_mask=row_mask)
+            if lexical_scores is not None and self.lexical_weight > 0:
+                has_text = torch.from_numpy(self._get_lexical_index().has_text)
+                lexical_scores = lexical_scores[remaining]
+                fuse = lambda semantic, lexical, with_text: torch.where(
+                    with_text, (1 - self.lexical_weight) * semantic + self.lexical_weight * lexical, semantic)
+                if rows is None:
+                    scores = fuse(scores, lexical_scores, has_text)
+                else:
+                    scores = [fuse(row_scores, lexical_scores[i, candidates], has_text[candidates])
+                              for i, (row_scores, candidates) in enumerate(zip(scores, rows))]
+
+            for i, hits in zip(remaining, self._pool_actions(scores, k=k, threshold=threshold, pooling=pooling, rows=rows)):
+                results[i] = hits
+        return results
+
+    def query_actions(self, text, k=5, threshold:float=None, pooling="max", namespaces=None, lexical_threshold:float=None):
+        """
+        Returns the k best distinct actions (id_names) for the text. See query_actions_batch.
+
+        Returns:
+            List[Tuple[str, float]]: The list of action names and their pooled scores, best first.
+        """
+        return self.query_actions_batch([text], k=k, threshold=threshold, pooling=pooling, namespaces=namespaces,
+                                        lexical_threshold=lexical_threshold)[0]
+
+    async def aquery_actions(self, text, k=5, threshold:float=None, pooling="max", namespaces=None, lexical_threshold:float=None):
+        """
+        Same as query_actions, without blocking the event loop. See aquery_actions_batch.
+        """
+        return (await self.aquery_actions_batch([text], k=k, threshold=threshold, pooling=pooling, namespaces=namespaces,
+                                                lexical_threshold=lexical_threshold))[0]
@@ -0,0 +1,84 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("h5py")
+from text_to_action.ann_index import IVFIndex
+
+
+def clustered_matrix(n_clusters=8, per_cluster=50, dim=16, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    centers = torch.randn(n_clusters, dim, generator=generator)
+    rows = centers.repeat_interleave(per_cluster, dim=0) + 0.1 * torch.randn(n_clusters * per_cluster, dim, generator=generator)
+    return torch.nn.functional.normalize(rows, dim=1)
+
+
+def score_rows(matrix):
+    return lambda query_embs, rows: query_embs @ matrix[rows].T
+
+
+def test_lists_cover_every_row_once():
+    matrix = clustered_matrix()
+    index = IVFIndex(n_lists=8)
+    index.build(matrix)
+
+    assert index.is_built
+    assert sorted(index.list_rows.tolist()) == list(range(matrix.shape[0]))
+    assert index.list_offsets[-1].item() == matrix.shape[0]
+
+
+def test_search_matches_exact_search_on_clustered_data():
+    matrix = clustered_matrix()
+    index = IVFIndex(n_lists=8, n_probe=2)
+    index.build(matrix)
+    queries = matrix[::37]
+
+    scores, rows = index.search(score_rows(matrix), queries, matrix.shape[0], k=5)
+    exact_rows = torch.topk(queries @ matrix.T, k=5, dim=1).indices.tolist()
+    hits = sum(len(set(approx) & set(exact)) for approx, exact in zip(rows, exact_rows))
+
+    assert hits / (5 * len(exact_rows)) >= 0.9
+    assert all(row_scores == sorted(row_scores, reverse=True) for row_scores in scores)
+
+
+def test_rows_added_after_the_build_are_always_candidates():
+    matrix = clustered_matrix()
+    index = IVFIndex(n_lists=8, n_probe=1)
+    index.build(matrix[:300])
+
+    candidates = index.candidate_rows(matrix[0], n_total_rows=matrix.shape[0]).tolist()
+
+    assert set(range(300, matrix.shape[0])) <= set(candidates)
+
+
+def test_row_mask_restricts_candidates():
+    matrix = clustered_matrix()
+    index = IVFIndex(n_lists=8, n_probe=8)
+    index.build(matrix)
+    row_mask = torch.zeros(matrix.shape[0], dtype=torch.bool)
+    row_mask[:10] = True
+
+    assert sorted(index.candidate_rows(matrix[0], matrix.shape[0], row_mask=row_mask).tolist()) == list(range(10))
+
+
+def test_needs_rebuild():
+    index = IVFIndex(n_lists=4, rebuild_ratio=0.1)
+    assert index.needs_rebuild(100)
+
+    index.build(clustered_matrix(n_clusters=4, per_cluster=25))
+    assert not index.needs_rebuild(105)
+    assert index.needs_rebuild(111)
+    assert index.needs_rebuild(99)
+
+
+def test_save_and_load(tmp_path):
+    matrix = clustered_matrix()
+    index = IVFIndex(n_lists=8)
+    index.build(matrix)
+    path = str(tmp_path / "embeddings.ivf.h5")
+    index.save(path, build_id="build-1")
+
+    loaded = IVFIndex()
+    assert loaded.load(path) == "build-1"
+    assert loaded.n_rows == index.n_rows
+    assert torch.equal(loaded.list_rows, index.list_rows)
+    assert torch.allclose(loaded.centroids, index.centroids)
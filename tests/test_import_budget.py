@@ -0,0 +1,58 @@
+"""
+Importing the package and its entry modules must stay cheap: the heavy dependencies are only loaded on first use.
+
+Each module is imported in a fresh interpreter with `-X importtime`. The budget can be changed with the
+TEXT_TO_ACTION_IMPORT_BUDGET_MS environment variable (default 500 ms).
+"""
+import json
+import os
+import subprocess
+import sys
+import pytest
+
+# Modules that must stay importable without loading any heavy dependency
+LIGHT_MODULES = ["text_to_action", "text_to_action.types", "text_to_action.create_actions", "text_to_action.main"]
+
+HEAVY_DEPENDENCIES = ["torch", "transformers", "sentence_transformers", "litellm", "openai", "spacy", "h5py", "deepdiff"]
+
+IMPORT_BUDGET_MS = float(os.environ.get("TEXT_TO_ACTION_IMPORT_BUDGET_MS", 500))
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+def measure_import(module:str)->dict:
+    """
+    Imports a module in a fresh interpreter.
+
+    Returns:
+        dict: The cumulative import time of the module in milliseconds and the heavy dependencies it loaded.
+    """
+    # A plain import statement is used because -X importtime doesn't log importlib.import_module
+    code = ("import json, sys; import %s; "
+            "print(json.dumps([m for m in %r if m in sys.modules]))") % (module, HEAVY_DEPENDENCIES)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [SRC_DIR, os.environ.get("PYTHONPATH")])))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        if "ModuleNotFoundError" in result.stderr:
+            pytest.skip(f"{module} needs a dependency that isn't installed: {result.stderr.strip().splitlines()[-1]}")
+        raise ImportError(f"Importing {module} failed:\n{result.stderr}")
+
+    # Lines look like: "import time:  self [us] | cumulative | imported package"
+    cumulative_us = 0
+    for line in result.stderr.splitlines():
+        parts = [part.strip() for part in line.replace("import time:", "").split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            cumulative_us = int(parts[1])
+    return {"import_ms": cumulative_us / 1000, "heavy_dependencies": json.loads(result.stdout.strip().splitlines()[-1])}
+
+
+@pytest.mark.parametrize("module", LIGHT_MODULES)
+def test_module_doesnt_load_heavy_dependencies(module):
+    report = measure_import(module)
+    assert report["heavy_dependencies"] == []
+
+
+@pytest.mark.parametrize("module", LIGHT_MODULES)
+def test_module_imports_within_budget(module):
+    report = measure_import(module)
+    assert report["import_ms"] <= IMPORT_BUDGET_MS
@@ -0,0 +1,53 @@
+import json
+from text_to_action.json_stream import IncrementalJSONParser
+
+
+def feed_in_chunks(text, size=1):
+    parser = IncrementalJSONParser()
+    events = []
+    for start in range(0, len(text), size):
+        events.extend(parser.feed(text[start:start + size]))
+    return parser, events
+
+
+def test_reports_array_elements_before_the_array():
+    text = '{"actions": ["resize image to 300x300", "add 20 and 50"], "message": "Sure."}'
+    parser, events = feed_in_chunks(text)
+
+    assert events == [(("actions", 0), "resize image to 300x300"),
+                      (("actions", 1), "add 20 and 50"),
+                      (("actions",), ["resize image to 300x300", "add 20 and 50"]),
+                      (("message",), "Sure.")]
+    assert parser.result == json.loads(text)
+    assert parser.done
+
+
+def test_element_is_reported_as_soon_as_it_is_complete():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"actions": ["first", "sec') == [(("actions", 0), "first")]
+    assert parser.feed('ond"') == [(("actions", 1), "second")]
+
+
+def test_skips_text_before_the_object_and_after_it():
+    text = '```json\n{"a": 20, "b": 3.5, "ok": true, "none": null}\n```'
+    parser, events = feed_in_chunks(text, size=4)
+
+    assert events == [(("a",), 20), (("b",), 3.5), (("ok",), True), (("none",), None)]
+    assert parser.result == {"a": 20, "b": 3.5, "ok": True, "none": None}
+    assert parser.done
+
+
+def test_nested_values_and_escaped_quotes():
+    text = '{"params": {"text": "say \\"hi\\", then {leave}"}, "actions": [{"name": "x"}]}'
+    parser, events = feed_in_chunks(text)
+
+    assert parser.result == json.loads(text)
+    assert (("actions", 0), {"name": "x"}) in events
+    assert (("params",), {"text": 'say "hi", then {leave}'}) in events
+
+
+def test_incomplete_object_keeps_completed_members():
+    parser, _ = feed_in_chunks('{"message": "Sure.", "actions": ["a", "b"')
+
+    assert parser.result == {"message": "Sure."}
+    assert not parser.done
@@ -0,0 +1,51 @@
+import numpy as np
+from text_to_action.lexical_index import LexicalIndex
+
+
+TEXTS = ["add 20 and 50", "20+50", "resize the image to 300x300", None, "sqrt 16"]
+
+
+def build(texts=TEXTS, **kwargs):
+    index = LexicalIndex(**kwargs)
+    index.build(texts)
+    return index
+
+
+def test_scores_have_one_row_per_query_and_column_per_text():
+    scores = build().score(["20+50", "resize image"])
+
+    assert scores.shape == (2, len(TEXTS))
+    assert scores.dtype == np.float32
+
+
+def test_identical_text_scores_one_and_best():
+    scores = build().score(["resize the image to 300x300"])[0]
+
+    assert np.isclose(scores[2], 1.0, atol=1e-5)
+    assert scores.argmax() == 2
+    assert (scores >= 0).all() and (scores <= 1 + 1e-5).all()
+
+
+def test_folded_digits_match_other_numbers():
+    assert build().score(["30+40"])[0].argmax() == 1
+    assert build(fold_digits=False).score(["30+40"])[0][1] < build().score(["30+40"])[0][1]
+
+
+def test_rows_without_text_never_match():
+    index = build()
+    scores = index.score(list(filter(None, TEXTS)))
+
+    assert not index.has_text[3]
+    assert (scores[:, 3] == 0).all()
+
+
+def test_unrelated_and_empty_queries_score_zero():
+    scores = build().score(["qqq", ""])
+
+    assert (scores == 0).all()
+
+
+def test_index_without_any_text():
+    index = build([None, None])
+
+    assert index.score(["add 20 and 50"]).tolist() == [[0.0, 0.0]]
@@ -0,0 +1,95 @@
+import time
+import pytest
+from text_to_action.llm_cache import LLMResponseCache
+
+
+class FakeClock:
+    """
+    Replaces time.time and time.monotonic, so that ttl expiry can be tested without sleeping.
+    """
+    def __init__(self, monkeypatch):
+        self.now = 1000.0
+        monkeypatch.setattr(time, "time", lambda: self.now)
+        monkeypatch.setattr(time, "monotonic", lambda: self.now)
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    return FakeClock(monkeypatch)
+
+
+def test_memory_tier():
+    cache = LLMResponseCache(maxsize=2)
+    cache.put("a", "response a")
+
+    assert cache.get("a") == "response a"
+    assert cache.get("b") is None
+    assert cache.stats()["memory_hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_disk_tier_is_shared_and_promoted(tmp_path):
+    path = str(tmp_path / "responses.db")
+    writer = LLMResponseCache(path=path)
+    writer.put("a", "response a")
+    reader = LLMResponseCache(path=path)
+
+    assert reader.get("a") == "response a"
+    assert reader.get("a") == "response a"
+    assert reader.stats()["disk_hits"] == 1
+    assert reader.stats()["memory_hits"] == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = LLMResponseCache(ttl=10)
+    cache.put("a", "response a")
+    clock.advance(9)
+    assert cache.get("a") == "response a"
+    clock.advance(2)
+    assert cache.get("a") is None
+
+
+def test_promoted_entries_keep_their_remaining_ttl(tmp_path, clock):
+    path = str(tmp_path / "responses.db")
+    LLMResponseCache(ttl=10, path=path).put("a", "response a")
+    clock.advance(8)
+    reader = LLMResponseCache(ttl=10, path=path)
+
+    assert reader.get("a") == "response a"
+    clock.advance(3)
+    assert reader.get("a") is None
+
+
+def test_disk_tier_evicts_oldest_entries(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(LLMResponseCache, "EVICT_INTERVAL", 1)
+    cache = LLMResponseCache(maxsize=1, path=str(tmp_path / "responses.db"), max_disk_entries=2)
+    for key in "abc":
+        cache.put(key, f"response {key}")
+        clock.advance(1)
+
+    assert cache.stats()["disk_size"] == 2
+    assert cache.get("a") is None
+    assert cache.get("b") == "response b"
+
+
+def test_key_depends_on_model_endpoint_messages_and_kwargs():
+    messages = [{"role": "user", "content": "Hello"}]
+    key = LLMResponseCache.key("model", messages, {"temperature": 0})
+
+    assert key == LLMResponseCache.key("model", [dict(messages[0])], {"temperature": 0})
+    assert key != LLMResponseCache.key("other", messages, {"temperature": 0})
+    assert key != LLMResponseCache.key("model", messages, {"temperature": 1})
+    assert (LLMResponseCache.key(None, messages, endpoint="http://localhost:8080")
+            != LLMResponseCache.key(None, messages, endpoint="http://localhost:8081"))
+
+
+def test_clear(tmp_path):
+    cache = LLMResponseCache(path=str(tmp_path / "responses.db"))
+    cache.put("a", "response a")
+    cache.clear()
+
+    assert cache.get("a") is None
+    assert cache.stats()["disk_size"] == 0